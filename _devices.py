@@ -1,17 +1,33 @@
 """
 This file is used by the Yombo core to create a device object for the specific zwave devices.
+
+The sensors, motion and noise detectors, clip recorder, quality controller and the frame hub (with its MJPEG
+parser and twisted.web.server) are imported when a device first uses them, so loading the module doesn't pay
+for NumPy, Pillow, the ffmpeg sensors or the streaming pipeline unless they're needed.
 """
+import os
+from time import time
+
 from twisted.internet import reactor
-from twisted.internet.defer import inlineCallbacks, CancelledError
+from twisted.internet.defer import inlineCallbacks, CancelledError, DeferredList, succeed
 
 from yombo.constants.features import FEATURE_DURATION
 from yombo.constants.status_extra import STATUS_EXTRA_DURATION
 from yombo.core.exceptions import YomboWarning
 from yombo.core.log import get_logger
 from yombo.lib.devices.camera import VideoCamera, Image
-from yombo.utils.ffmpeg.sensor import SensorNoise, SensorMotion
 
-from . import const
+from . import const, fleet
+from .change_tracker import ChangeTracker
+from .circuit_breaker import CircuitBreaker, is_unreachable
+from .image_pool import resize_jpeg, JobDropped, IMAGE_POOL_AVAILABLE
+from .metrics import DeviceMetrics, http_error, response_size
+from .zones import parse_polygons
+from .sensor_store import SensorStore
+from .command_queue import SettingsCommandQueue
+from .connection_pool import DeviceConnectionPool
+from .settings import SettingsSnapshot
+from .snapshot_cache import SnapshotCache
 
 logger = get_logger("modules.android_ipwebcam.device")
 
@@ -22,25 +38,47 @@ class Android_IPWebCam(VideoCamera):
         super().__init__(*args, **kwargs)
         self.SUB_PLATFORM = const.PLATFORM_ANDROID_IP_WEBCAM
         self.status_data = None
-        self.sensor_data = None
+        self.settings = SettingsSnapshot()
+        self.settings_queue = SettingsCommandQueue(self._write_setting, lambda key: self.settings.raw(key))
+        self.sensor_store = SensorStore(const.SENSOR_HISTORY_SIZE)
+        self.sensor_samples_received = 0
+        self.change_tracker = ChangeTracker(self)
+        self._sensors_polled = False
+        self._sensors_in_use = set()
         self._timeout = 5
         self._available = True
+        self.update_timings = {"status": None, "sensors": None}
+        self.last_activity = None
         self._motion_sensor_device = None
-        self._motion_sensor_ffmpeg = None
+        self._motion_sensor = None
+        self._motion_sensor_params = None
         self._noise_sensor_device = None
-        self._noise_sensor_ffmpeg = None
+        self._noise_sensor = None
+        self._noise_sensor_params = None
+        self.clip_recorder = None
+        self.quality_controller = None
+        self._stream_key = None
 
         self._motion_enabled = None
         self._motion_sensitivity = None
         self._motion_reactivate_timeout = None
         self._motion_low_timeout = None
         self._motion_framerate = None
+        self._motion_zones = None
+        self._motion_exclusions = None
         self._noise_enabled = None
         self._noise_sensitivity = None
         self._noise_reactivate_timeout = None
         self._noise_low_timeout = None
+        self.http_pool = DeviceConnectionPool()
+        self.metrics = DeviceMetrics()
+        self.breaker = CircuitBreaker(self.machine_label, self._probe, recovered=self.mark_activity)
+        self._frame_hub = None
+        self.snapshot_cache = SnapshotCache(lambda: self._frame_hub, self._fetch_image)
 
-        reactor.callLater(0.05, self._reload_)  # Dont' hold up the system, spawn a child.
+        fleet.register(self)
+        # Dont' hold up the system, spawn a child. The gate limits how many cameras reload at once.
+        reactor.callLater(0.05, fleet.reload_gate.run, self._reload_)
 
     def _unload(self, **kwargs):
         """
@@ -49,10 +87,20 @@ class Android_IPWebCam(VideoCamera):
         :param kwargs:
         :return:
         """
-        if self._motion_sensor_ffmpeg is not None:
-            self._motion_sensor_ffmpeg.close()
-        if self._noise_sensor_ffmpeg is not None:
-            self._noise_sensor_ffmpeg.close()
+        fleet.unregister(self)
+        if self._motion_sensor is not None:
+            self._motion_sensor.close()
+        if self._noise_sensor is not None:
+            self._noise_sensor.close()
+        if self.clip_recorder is not None:
+            self.clip_recorder.close()
+        if self.quality_controller is not None:
+            self.quality_controller.stop()
+        if self._frame_hub is not None:
+            self._frame_hub.close()
+        self.breaker.close()
+        fleet.thumbnail_cache.remove_device(self.device_id)
+        self.http_pool.closeCachedConnections()
 
     @inlineCallbacks
     def _reload_(self, **kwargs):
@@ -102,6 +150,14 @@ class Android_IPWebCam(VideoCamera):
             self._motion_framerate = self.device_variables_cached["motion_framerate"]["values"][0]
         except KeyError:
             self._motion_framerate = 8
+        try:
+            self._motion_zones = parse_polygons(self.device_variables_cached["motion_zones"]["values"])
+        except KeyError:
+            self._motion_zones = []
+        try:
+            self._motion_exclusions = parse_polygons(self.device_variables_cached["motion_exclusions"]["values"])
+        except KeyError:
+            self._motion_exclusions = []
         try:
             self._noise_enabled = self.device_variables_cached["noise_enabled"]["values"][0]
         except KeyError:
@@ -120,58 +176,251 @@ class Android_IPWebCam(VideoCamera):
             self._noise_low_timeout = self.device_variables_cached["noise_low_timeout"]["values"][0]
         except KeyError:
             self._noise_low_timeout = 30
+        try:
+            self.snapshot_cache.max_age = float(self.device_variables_cached["snapshot_max_age"]["values"][0])
+        except (KeyError, TypeError, ValueError):
+            self.snapshot_cache.max_age = 1.0
+        try:
+            self.settings_queue.debounce = float(self.device_variables_cached["settings_debounce"]["values"][0])
+        except (KeyError, TypeError, ValueError):
+            self.settings_queue.debounce = 0.1
+        try:
+            http_pool_size = int(self.device_variables_cached["http_pool_size"]["values"][0])
+        except (KeyError, TypeError, ValueError):
+            http_pool_size = 2
+        try:
+            http_idle_timeout = int(self.device_variables_cached["http_idle_timeout"]["values"][0])
+        except (KeyError, TypeError, ValueError):
+            http_idle_timeout = 60
+        self.http_pool.configure(http_pool_size, http_idle_timeout)
+        try:
+            breaker_failures = int(self.device_variables_cached["breaker_failures"]["values"][0])
+        except (KeyError, TypeError, ValueError):
+            breaker_failures = 3
+        try:
+            breaker_reset = float(self.device_variables_cached["breaker_reset_timeout"]["values"][0])
+        except (KeyError, TypeError, ValueError):
+            breaker_reset = 10
+        self.breaker.configure(breaker_failures, breaker_reset)
 
         # print("11111111: before update")
         yield self.update()
 
         # print(f"11111111: self._motion_enabled: {self._motion_enabled}")
 
-        if self._motion_enabled is True:
-            # print("11111111: enabled")
-            if self._motion_sensor_device is None:
-                # print("11111111: no motion sensor device.")
-                self._motion_sensor_device = yield self._Devices.create_child_device(
-                    self,
-                    label="Motion",
-                    machine_label="motion",
-                    device_type="motion_sensor",
-                )
-            self._motion_sensor_device.FEATURES[FEATURE_DURATION] = True
-            self._motion_sensor_device.MACHINE_STATUS_EXTRA_FIELDS[STATUS_EXTRA_DURATION] = True
+        stream_key = (self.base_url, self.request_auth)
+        stream_changed = self._stream_key is not None and stream_key != self._stream_key
+        self._stream_key = stream_key
+        if stream_changed and self._frame_hub is not None:
+            self._frame_hub.restart()
+
+        yield self._configure_motion_sensor(stream_changed)
+        yield self._configure_noise_sensor(stream_changed)
+        self._configure_recorder()
+        self._configure_quality_controller()
+
+        fleet.reloaded(self)
+
+    @inlineCallbacks
+    def _configure_motion_sensor(self, stream_changed):
+        """
+        Create, update or remove the motion sensor to match the device variables. Settings are changed in
+        place when possible; the sensor is only restarted when it can't be updated in place.
+
+        :param stream_changed: True if the camera's url or auth changed.
+        """
+        if self._motion_enabled is not True:
+            if self._motion_sensor is not None:
+                self._motion_sensor.close()
+                self._motion_sensor = None
+            return
+
+        if self._motion_sensor_device is None:
+            # print("11111111: no motion sensor device.")
+            self._motion_sensor_device = yield self._Devices.create_child_device(
+                self,
+                label="Motion",
+                machine_label="motion",
+                device_type="motion_sensor",
+            )
             self._motion_sensor_device.set_status(machine_status=0)
+        self._motion_sensor_device.FEATURES[FEATURE_DURATION] = True
+        self._motion_sensor_device.MACHINE_STATUS_EXTRA_FIELDS[STATUS_EXTRA_DURATION] = True
+        self._motion_sensor_device.MACHINE_STATUS_EXTRA_FIELDS["zone"] = True
+
+        params = {
+            "sensitivity": self._motion_sensitivity,
+            "denoise": self._motion_denoise,
+            "reactivate_timeout": self._motion_reactivate_timeout,
+            "low_timeout": self._motion_low_timeout,
+            "framerate": self._motion_framerate,
+        }
+        from .motion import MotionDetector, MOTION_AVAILABLE
+        if self._motion_sensor is not None:
+            if isinstance(self._motion_sensor, MotionDetector):
+                # Stream changes are handled by the frame hub.
+                self._motion_sensor.reconfigure(zones=self._motion_zones, exclusions=self._motion_exclusions,
+                                                **params)
+                return
+            if params == self._motion_sensor_params and stream_changed is False:
+                return
+            self._motion_sensor.close()
+
+        # Analyze the frame hub's frames in process when possible, otherwise fall back to ffmpeg.
+        if MOTION_AVAILABLE:
+            self._motion_sensor = MotionDetector(self.frame_hub, fleet.image_pool, self.motion_sensor_callback,
+                                                 zones=self._motion_zones,
+                                                 exclusions=self._motion_exclusions,
+                                                 connected_callback=self.motion_sensor_connected,
+                                                 closed_callback=self.motion_sensor_closed,
+                                                 **params)
+            yield self._motion_sensor.open_sensor()
+        else:
+            if self._motion_zones or self._motion_exclusions:
+                logger.info("Motion zones require NumPy and Pillow, using the whole frame.")
+            from yombo.utils.ffmpeg.sensor import SensorMotion
+            self._motion_sensor = SensorMotion(self, self.motion_sensor_callback,
+                                               connected_callback=self.motion_sensor_connected,
+                                               closed_callback=self.motion_sensor_closed,
+                                               **params)
+            # Read from the frame hub's relay so ffmpeg doesn't open another connection to the phone.
+            yield fleet.launch_gate.run(self._motion_sensor.open_sensor, self.frame_hub.relay_url,
+                                        source_type="video")
+        self._motion_sensor_params = params
+
+    def _configure_recorder(self):
+        """
+        Setup the event clip recorder from the device variables. Clips are recorded when motion is detected,
+        so recording also requires motion detection to be enabled.
+        """
+        try:
+            enabled = self.device_variables_cached["recording_enabled"]["values"][0]
+        except KeyError:
+            enabled = False
+        if enabled is not True or self._motion_enabled is not True:
+            if self.clip_recorder is not None:
+                self.clip_recorder.close()
+                self.clip_recorder = None
+            return
+
+        try:
+            directory = self.device_variables_cached["recording_directory"]["values"][0]
+        except KeyError:
+            directory = None
+        if not directory:
+            directory = os.path.join(os.path.expanduser("~"), ".yombo", "recordings", "android_ipwebcam")
+        try:
+            pre_seconds = float(self.device_variables_cached["recording_pre_seconds"]["values"][0])
+        except (KeyError, TypeError, ValueError):
+            pre_seconds = 5
+        try:
+            buffer_bytes = int(float(self.device_variables_cached["recording_buffer_mb"]["values"][0]) * 1048576)
+        except (KeyError, TypeError, ValueError):
+            buffer_bytes = 16 * 1048576
+
+        recorder = self.clip_recorder
+        if recorder is not None and recorder.directory == directory and \
+                recorder.arena.max_age == pre_seconds and recorder.arena.capacity == buffer_bytes:
+            return
+        if recorder is not None:
+            recorder.close()
+        from .recorder import ClipRecorder
+        self.clip_recorder = ClipRecorder(self.frame_hub, directory, self.machine_label,
+                                          pre_seconds=pre_seconds, max_bytes=buffer_bytes)
+        self.clip_recorder.open()
+
+    def _configure_quality_controller(self):
+        """
+        Start, update or stop the automatic quality controller from the device variables.
+        """
+        try:
+            enabled = self.device_variables_cached["auto_quality"]["values"][0]
+        except KeyError:
+            enabled = False
+        if enabled is not True:
+            if self.quality_controller is not None:
+                self.quality_controller.stop()
+                self.quality_controller = None
+            return
+
+        try:
+            min_fps = float(self.device_variables_cached["auto_quality_min_fps"]["values"][0])
+        except (KeyError, TypeError, ValueError):
+            min_fps = 10
+        try:
+            min_quality = float(self.device_variables_cached["auto_quality_min_quality"]["values"][0])
+        except (KeyError, TypeError, ValueError):
+            min_quality = 30
+        try:
+            max_latency = float(self.device_variables_cached["auto_quality_max_latency"]["values"][0])
+        except (KeyError, TypeError, ValueError):
+            max_latency = 1.0
+
+        if self.quality_controller is None:
+            from .quality_controller import QualityController
+            self.quality_controller = QualityController(self, min_fps=min_fps, min_quality=min_quality,
+                                                        max_latency=max_latency)
+            self.quality_controller.start()
+        else:
+            self.quality_controller.reconfigure(min_fps, min_quality, max_latency)
 
-            if self._motion_sensor_ffmpeg is None:
-                self._motion_sensor_ffmpeg = SensorMotion(self, self.motion_sensor_callback,
-                                                          sensitivity=self._motion_sensitivity,
-                                                          denoise=self._motion_denoise,
-                                                          reactivate_timeout=self._motion_reactivate_timeout,
-                                                          low_timeout=self._motion_low_timeout,
-                                                          framerate=self._motion_framerate,
-                                                          connected_callback=self.motion_sensor_connected,
-                                                          closed_callback=self.motion_sensor_closed)
-            else:
-                self._motion_sensor_ffmpeg.close()
-            yield self._motion_sensor_ffmpeg.open_sensor(self.video_url, source_type="video")
-
-        if self._noise_enabled is True:
-            if self._noise_sensor_device is None:
-                self._noise_sensor_device = yield self._Devices.create_child_device(
-                    self,
-                    label="Noise",
-                    machine_label="noise",
-                    device_type="noise_sensor",
-                )
-            self._noise_sensor_device.FEATURES[FEATURE_DURATION] = True
-            self._noise_sensor_device.MACHINE_STATUS_EXTRA_FIELDS[STATUS_EXTRA_DURATION] = True
+    @inlineCallbacks
+    def _configure_noise_sensor(self, stream_changed):
+        """
+        Create, update or remove the noise sensor to match the device variables. Settings are changed in
+        place when possible; the audio stream is only reconnected if the camera's url or auth changed.
+
+        :param stream_changed: True if the camera's url or auth changed.
+        """
+        if self._noise_enabled is not True:
+            if self._noise_sensor is not None:
+                self._noise_sensor.close()
+                self._noise_sensor = None
+            return
+
+        if self._noise_sensor_device is None:
+            self._noise_sensor_device = yield self._Devices.create_child_device(
+                self,
+                label="Noise",
+                machine_label="noise",
+                device_type="noise_sensor",
+            )
             self._noise_sensor_device.set_status(machine_status=0)
+        self._noise_sensor_device.FEATURES[FEATURE_DURATION] = True
+        self._noise_sensor_device.MACHINE_STATUS_EXTRA_FIELDS[STATUS_EXTRA_DURATION] = True
 
-            if self._noise_sensor_ffmpeg is None:
-                self._noise_sensor_ffmpeg = SensorNoise(self, self.noise_sensor_callback, low_timeout=10,
-                                                        connected_callback=self.noise_sensor_connected,
-                                                        closed_callback=self.noise_sensor_closed)
-            else:
-                self._noise_sensor_ffmpeg.close()
-            yield self._noise_sensor_ffmpeg.open_sensor(self.audio_url)
+        params = {
+            "sensitivity": self._noise_sensitivity,
+            "reactivate_timeout": self._noise_reactivate_timeout,
+            "low_timeout": self._noise_low_timeout,
+        }
+        from .noise import NoiseDetector, NOISE_AVAILABLE
+        if self._noise_sensor is not None:
+            if isinstance(self._noise_sensor, NoiseDetector):
+                self._noise_sensor.reconfigure(**params)
+                if stream_changed:
+                    self._noise_sensor.close()
+                    yield self._noise_sensor.open_sensor(self.audio_url)
+                return
+            if params == self._noise_sensor_params and stream_changed is False:
+                return
+            self._noise_sensor.close()
+
+        # Measure the audio stream in process when possible, otherwise fall back to ffmpeg.
+        if NOISE_AVAILABLE:
+            self._noise_sensor = NoiseDetector(self, self.noise_sensor_callback,
+                                               connected_callback=self.noise_sensor_connected,
+                                               closed_callback=self.noise_sensor_closed,
+                                               **params)
+            yield self._noise_sensor.open_sensor(self.audio_url)
+        else:
+            from yombo.utils.ffmpeg.sensor import SensorNoise
+            self._noise_sensor = SensorNoise(self, self.noise_sensor_callback,
+                                             connected_callback=self.noise_sensor_connected,
+                                             closed_callback=self.noise_sensor_closed,
+                                             **params)
+            yield fleet.launch_gate.run(self._noise_sensor.open_sensor, self.audio_url)
+        self._noise_sensor_params = params
 
     def noise_sensor_connected(self, **kwargs):
         print(f"noise_sensor_connected.")
@@ -198,15 +447,39 @@ class Android_IPWebCam(VideoCamera):
         # print(f"motion_sensor_closed.")
         pass
 
-    def motion_sensor_callback(self, state, duration, trip_count):
+    def motion_sensor_callback(self, state, duration, trip_count, zone=None):
         """
         Testing noise sensor
         :param motion_start:
+        :param zone: Name of the motion zone that tripped, if zones are set.
         :return:
         """
         # print(f"motion_sensor_callback: state: {state}, duration: {duration} seconds, trip_count: {trip_count}")
+        if state:
+            self.mark_activity()
+        machine_status_extra = {FEATURE_DURATION: duration}
+        if zone is not None:
+            machine_status_extra["zone"] = zone
         self._motion_sensor_device.set_status(machine_status=state,
-                                              machine_status_extra={FEATURE_DURATION: duration})
+                                              machine_status_extra=machine_status_extra)
+        if self.clip_recorder is not None:
+            try:
+                if state:
+                    self.clip_recorder.start_clip()
+                else:
+                    self.clip_recorder.stop_clip()
+            except Exception as e:
+                logger.warn("Clip recorder error: {error}", error=e)
+
+    @property
+    def frame_hub(self):
+        """
+        The device's FrameHub, created the first time something needs the live stream.
+        """
+        if self._frame_hub is None:
+            from .frame_hub import FrameHub
+            self._frame_hub = FrameHub(self)
+        return self._frame_hub
 
     @property
     def video_url(self):
@@ -229,41 +502,161 @@ class Android_IPWebCam(VideoCamera):
         return self._available
 
     @inlineCallbacks
-    def camera_image(self):
+    def camera_image(self, width=None, height=None, quality=None):
         """
-        Fetches a single image from the camera, and returns an Image instance.
+        Returns an Image instance of the camera's current image. Images are served from the snapshot cache,
+        which is filled from the frame hub while it's streaming, otherwise from /shot.jpg.
 
+        When a size or quality is given, the image is scaled to fit within it. Resized images are cached per
+        snapshot, so each one is only resized once however many viewers ask. If the resize can't be done,
+        the full size image is returned.
+
+        :param width: Most pixels wide, None for any.
+        :param height: Most pixels high, None for any.
+        :param quality: JPEG quality, 1-95. Defaults to 80 when resizing.
         :return:
         """
-        image_results = yield self._Requests.request("get", self.image_url, self.request_auth)
-        return Image(content_type=image_results["headers"]["content-type"][0], iamge=image_results["content"])
+        snapshot = yield self.snapshot_cache.get()
+        if (width is None and height is None and quality is None) or IMAGE_POOL_AVAILABLE is False:
+            return Image(content_type=snapshot.content_type, image=snapshot.data)
+
+        size = (width, height, 80 if quality is None else int(quality))
+        try:
+            image = yield fleet.thumbnail_cache.get(self.device_id, size, snapshot.sequence,
+                                                    lambda: self._resize_snapshot(snapshot.data, *size))
+        except JobDropped as e:
+            logger.debug("Serving the full size image, resize dropped: {error}", error=e)
+            return Image(content_type=snapshot.content_type, image=snapshot.data)
+        return Image(content_type="image/jpeg", image=image)
+
+    @inlineCallbacks
+    def _resize_snapshot(self, data, width, height, quality):
+        """
+        Resize a snapshot for the thumbnail cache.
+
+        :return: The resized jpeg bytes.
+        """
+        results = yield self.resize_image(data, width, height, quality, droppable=False)
+        return results[0]
 
     @inlineCallbacks
-    def _request(self, path, **kwargs):
+    def _fetch_image(self):
         """
-        Make a request to the android ip webcam.
+        Fetches a single image from the phone, used by the snapshot cache. Fails immediately while the
+        circuit breaker is open.
+
+        :return: A tuple of (content_type, image bytes).
+        """
+        if self.breaker.allow() is False:
+            self.metrics.rejected("/shot.jpg")
+            raise YomboWarning(f"IP Webcam {self.machine_label} is unreachable.")
+        start = time()
+        try:
+            image_results = yield self._Requests.request("get", self.image_url, auth=self.request_auth,
+                                                         pool=self.http_pool)
+        except (CancelledError, YomboWarning) as e:
+            self.metrics.record("/shot.jpg", time() - start, error=type(e).__name__)
+            if is_unreachable(e):
+                self.breaker.failure()
+            raise
+        error = http_error(image_results)
+        self.metrics.record("/shot.jpg", time() - start, response_size(image_results), error)
+        self.breaker.success()
+        if error is not None:
+            raise YomboWarning(f"IP Webcam {self.machine_label} returned {error} for an image.")
+        return image_results["headers"]["content-type"][0], image_results["content"]
+
+    def _probe(self):
         """
+        Cheap request used by the circuit breaker to check if the camera is reachable again.
+
+        :return: Deferred
+        """
+        return self._Requests.request("get", f"{self.base_url}/status.json", auth=self.request_auth,
+                                      pool=self.http_pool)
+
+    def resize_image(self, data, width=None, height=None, quality=80, droppable=True):
+        """
+        Downscale a JPEG on the image worker pool, keeping the aspect ratio.
+
+        :param data: JPEG bytes or memoryview.
+        :param width: Most pixels wide.
+        :param height: Most pixels high.
+        :param quality: JPEG quality.
+        :param droppable: If False, the job waits for a worker instead of being dropped when the pool is full.
+        :return: Deferred that fires with a tuple of (jpeg bytes, width, height).
+        """
+        if IMAGE_POOL_AVAILABLE is False:
+            raise YomboWarning("Resizing images requires Pillow.")
+        return fleet.image_pool.submit(resize_jpeg, data, width, height, quality, droppable=droppable)
+
+    def mjpeg_stream(self, request):
+        """
+        Stream live video to a web request. All viewers share the frame hub's single connection to the phone.
+
+        :param request: A twisted web request.
+        :return:
+        """
+        self.frame_hub.serve_mjpeg(request)
+
+    @inlineCallbacks
+    def _request(self, path, update_available=True, **kwargs):
+        """
+        Make a request to the android ip webcam. While the circuit breaker is open, returns None right away
+        without contacting the camera.
+
+        :param path: Path to request, such as "/status.json".
+        :param update_available: If False, the result of this request doesn't change the available status.
+        """
+        if self.breaker.allow() is False:
+            self.metrics.rejected(path)
+            logger.debug("Skipping request to unreachable IP Webcam: {path}", path=path)
+            if update_available:
+                self._available = False
+            return
         url = f"{self.base_url}{path}"
         data = None
         if "auth" not in kwargs:
             kwargs["auth"] = self.request_auth
+        kwargs["pool"] = self.http_pool
 
+        start = time()
         try:
                 image_results = yield self._Requests.request("get", url, **kwargs)
                 response = image_results["response"]
                 # if response.status == 200:
                 data = image_results["content"]
         except (CancelledError, YomboWarning) as e:
+            self.metrics.record(path, time() - start, error=type(e).__name__)
             logger.error(f"Error communicating with IP Webcam: {e}")
-            self._available = False
+            if is_unreachable(e):
+                self.breaker.failure()
+                if update_available:
+                    self._available = False
             return
 
-        self._available = True
+        self.metrics.record(path, time() - start, response_size(image_results), http_error(image_results))
+        self.breaker.success()
+        if update_available and self._available is not True:
+            self._available = True
+            fleet.became_available(self)
         if isinstance(data, str):
             return data.find("Ok") != -1
         else:
             return data
 
+    @property
+    def sensor_meters(self):
+        """
+        Returns the frame rate and processing time meters of the in process motion and noise detectors.
+        """
+        meters = {}
+        for name, sensor in (("motion", self._motion_sensor), ("noise", self._noise_sensor)):
+            meter = getattr(sensor, "meter", None)
+            if meter is not None:
+                meters[name] = meter
+        return meters
+
     @property
     def debug_data(self):
         """
@@ -272,6 +665,11 @@ class Android_IPWebCam(VideoCamera):
         :return:
         """
         debug_data = super().debug_data
+        snapshot = self.snapshot_cache.snapshot
+        if snapshot is None:
+            last_image = "not avail"
+        else:
+            last_image = f"{len(snapshot.data)} bytes, {snapshot.age:.1f} seconds old, from {snapshot.source}"
         debug_data["android_ip_webcam"] = {
             'title': _("module::android_ip_webcam::ui::debug_header", "Android IP Webcam device details"),
             'description': _("module::android_ip_webcam::ui::debug_description", "Data as reported by the Android IP Webcam device."),
@@ -284,7 +682,33 @@ class Android_IPWebCam(VideoCamera):
                 _("module::android_ip_webcam::ui::debug::video_url", "Video URL"): self.video_url,
                 _("module::android_ip_webcam::ui::debug::image_url", "Image URL"): self.image_url,
                 _("module::android_ip_webcam::ui::debug::audio_url", "Audio URL"): self.audio_url,
-                _("module::android_ip_webcam::ui::debug::last_image", "Last Image"): "not avail",
+                _("module::android_ip_webcam::ui::debug::last_image", "Last Image"): last_image,
+                _("module::android_ip_webcam::ui::debug::snapshot_cache", "Snapshot cache"):
+                    self.snapshot_cache.stats,
+                _("module::android_ip_webcam::ui::debug::thumbnail_cache", "Thumbnail cache"):
+                    fleet.thumbnail_cache.device_stats(self.device_id),
+                _("module::android_ip_webcam::ui::debug::update_timings", "Update timings"): self.update_timings,
+                _("module::android_ip_webcam::ui::debug::sensor_samples", "Sensor samples last update"):
+                    self.sensor_samples_received,
+                _("module::android_ip_webcam::ui::debug::changes", "Change detection"): self.change_tracker.stats,
+                _("module::android_ip_webcam::ui::debug::settings_queue", "Settings queue"):
+                    self.settings_queue.stats,
+                _("module::android_ip_webcam::ui::debug::http_pool", "HTTP connections"): self.http_pool.stats,
+                _("module::android_ip_webcam::ui::debug::breaker", "Circuit breaker"): self.breaker.stats,
+                _("module::android_ip_webcam::ui::debug::requests", "Requests by endpoint"): self.metrics.stats,
+                _("module::android_ip_webcam::ui::debug::motion", "Motion detector"):
+                    getattr(self._motion_sensor, "stats", None),
+                _("module::android_ip_webcam::ui::debug::noise", "Noise detector"):
+                    getattr(self._noise_sensor, "stats", None),
+                _("module::android_ip_webcam::ui::debug::recorder", "Clip recorder"):
+                    None if self.clip_recorder is None else self.clip_recorder.stats,
+                _("module::android_ip_webcam::ui::debug::quality_controller", "Automatic quality"):
+                    None if self.quality_controller is None else self.quality_controller.stats,
+                _("module::android_ip_webcam::ui::debug::polling", "Polling"):
+                    None if fleet.poll_scheduler is None else fleet.poll_scheduler.device_stats(self),
+                _("module::android_ip_webcam::ui::debug::frame_hub", "Frame hub"):
+                    None if self._frame_hub is None else self._frame_hub.stats,
+                _("module::android_ip_webcam::ui::debug::image_pool", "Image workers"): fleet.image_pool.stats,
             }
         }
         return debug_data
@@ -293,15 +717,82 @@ class Android_IPWebCam(VideoCamera):
     def update(self):
         """
         Get the Android IP Webcam status and update sensor data.
+
+        Status and sensors are requested at the same time. Only a failed status request marks the camera
+        as unavailable; if just the sensors request fails, the previous sensor data is kept. Change listeners
+        are told about any settings, connection counts or sensor values that are different from the last poll.
         """
-        status_data = yield self._request("/status.json", params={"show_avail": 1})
+        poll = self.settings_queue.poll_started()
+        results = yield DeferredList([
+            self._timed_request("status", "/status.json", params={"show_avail": 1}),
+            self._request_sensors(),
+        ], consumeErrors=True)
+        (status_success, status_data), (sensor_success, sensor_data) = results
 
-        if status_data:
+        if status_success is False:
+            logger.error(f"Error getting IP Webcam status: {status_data.getErrorMessage()}")
+            self._available = False
+        elif status_data:
             self.status_data = status_data
+            if self.change_tracker.status_updated(status_data) is not None:
+                self.settings = self.settings.updated(status_data)
+            self.settings_queue.settings_updated(poll)
+
+        if sensor_success is False:
+            logger.warn(f"Error getting IP Webcam sensors: {sensor_data.getErrorMessage()}")
+        elif sensor_data:
+            self.sensor_samples_received = self.sensor_store.merge(sensor_data)
+            self._sensors_polled = True
+            self.change_tracker.sensors_updated(sensor_data, self.sensor_store)
 
-            sensor_data = yield self._request("/sensors.json")
-            if sensor_data:
-                self.sensor_data = sensor_data
+    def add_change_listener(self, callback, sections=None, keys=None):
+        """
+        Call callback(device, changes) after a poll finds changed values, with a list of change_tracker.Change.
+
+        :param callback: Function to call.
+        :param sections: Only these of "curvals", "connections" and "sensors", None for all.
+        :param keys: Only these setting, connection or sensor names, such as ("torch",), None for all.
+        """
+        self.change_tracker.add_listener(callback, sections, keys)
+
+    def remove_change_listener(self, callback):
+        """
+        Stop calling a callback added with add_change_listener.
+        """
+        self.change_tracker.remove_listener(callback)
+
+    def _request_sensors(self):
+        """
+        Request only new sensor samples. The first request gets everything so the available sensors are
+        known, after that only the sensors that have been read are requested, starting from the oldest
+        timestamp already seen for them. Names the phone has never reported are left out, otherwise a single
+        unknown name would make every request start from 0 and download the full history.
+
+        :return: Deferred
+        """
+        params = {}
+        if self._sensors_polled is True:
+            sensors = [name for name in self._sensors_in_use if name in self.sensor_store]
+            if not sensors:
+                return succeed(None)
+            params["sense"] = ",".join(sorted(sensors))
+            params["from"] = int(min(self.sensor_store.last_timestamp(name) for name in sensors))
+        return self._timed_request("sensors", "/sensors.json", update_available=False, params=params)
+
+    @inlineCallbacks
+    def _timed_request(self, name, path, **kwargs):
+        """
+        Calls _request and saves how long it took in update_timings.
+
+        :param name: Key to save the timing under.
+        :param path: Path to request.
+        """
+        start = time()
+        try:
+            results = yield self._request(path, **kwargs)
+        finally:
+            self.update_timings[name] = round(time() - start, 4)
+        return results
 
     @property
     def current_connections(self):
@@ -324,95 +815,106 @@ class Android_IPWebCam(VideoCamera):
     @property
     def current_settings(self):
         """
-        Returns a dictionary of the current active settings.
+        Returns a read only dictionary of the current active settings.
         """
-        settings = {}
-        if not self.status_data:
-            return settings
-
-        for (key, val) in self.status_data.get("curvals", {}).items():
-            try:
-                val = float(val)
-            except ValueError:
-                val = val
-
-            if val == "on" or val == "off":
-                val = (val == "on")
-
-            settings[key] = val
-
-        return settings
+        return self.settings.current
 
     @property
     def available_settings(self):
         """
-        Related to current_settings, but shows all currentl available settings. Returns a dictionary with all possible
-        settings.
+        Related to current_settings, but shows all currentl available settings. Returns a read only dictionary
+        with a tuple of all possible values for each setting.
         """
-        available = {}
-        if not self.status_data:
-            return available
-
-        for (key, val) in self.status_data.get("avail", {}).items():
-            available[key] = []
-            for subval in val:
+        return self.settings.available
 
-                try:
-                    subval = float(subval)
-                except ValueError:
-                    subval = subval
-
-                if subval == "on" or subval == "off":
-                    subval = (subval == "on")
-
-                available[key].append(subval)
-
-        return available
+    @property
+    def settings_version(self):
+        """
+        Returns a number that changes whenever the camera reports different settings.
+        """
+        return self.settings.version
 
     @property
     def enabled_sensors(self):
         """
         Returns a list of the enabled sensors.
         """
-        if self.sensor_data is None:
-            return []
-        return list(self.sensor_data.keys())
+        return self.sensor_store.names
 
     @property
     def enabled_settings(self):
         """
         Return a list of available settings.
         """
-        if self.status_data is None:
-            return []
-        return list(self.status_data.get("curvals", {}).keys())
+        return list(self.settings.current)
 
     def export_sensor(self, sensor):
         """Return (value, unit) from a sensor node."""
-        value = None
-        unit = None
-        try:
-            container = self.sensor_data.get(sensor)
-            unit = container.get("unit")
-            data_point = container.get("data", [[0, [0.0]]])
-            if data_point and data_point[0]:
-                value = data_point[0][-1][0]
-        except (ValueError, KeyError, AttributeError):
-            pass
-        return value, unit
+        self._sensors_in_use.add(sensor)
+        series = self.sensor_store.get(sensor)
+        if series is None:
+            return None, None
+        latest = series.latest
+        if latest is None:
+            return None, series.unit
+        return latest[1][0], series.unit
+
+    def sensor_history(self, sensor, seconds=None):
+        """
+        Returns the stored samples for a sensor, oldest first.
+
+        :param sensor: Sensor name, such as "battery_level".
+        :param seconds: How far back from the newest sample to go, None for all stored samples.
+        :return: A tuple of (timestamps, [values for each column]), or None if the sensor isn't known.
+        """
+        self._sensors_in_use.add(sensor)
+        series = self.sensor_store.get(sensor)
+        if series is None:
+            return None
+        return series.window(seconds)
+
+    def sensor_stats(self, sensor, seconds=None):
+        """
+        Returns the min, max and mean of a sensor over the last seconds.
+
+        :param sensor: Sensor name, such as "battery_level".
+        :param seconds: How far back from the newest sample to go, None for all stored samples.
+        :return: Dictionary with count, min, max and mean, or None if the sensor isn't known.
+        """
+        self._sensors_in_use.add(sensor)
+        series = self.sensor_store.get(sensor)
+        if series is None:
+            return None
+        return series.stats(seconds)
 
     @inlineCallbacks
     def change_setting(self, key, val):
         """
-        Change a camera setting.
+        Change a camera setting. Changes are sent after a short debounce window; if the same setting is
+        changed again within the window only the last value is sent, and values the camera already has are
+        not sent at all.
         """
         if isinstance(val, bool):
             payload = "on" if val else "off"
         else:
             payload = val
-        results = yield self._request(f"/settings/{key}", params={"set": payload})
+        self.mark_activity()
+        results = yield self.settings_queue.set(key, payload)
         return results
 
+    def mark_activity(self):
+        """
+        Note that something happened on this camera, the poll scheduler polls it faster for a while.
+        """
+        self.last_activity = time()
+        fleet.activity(self)
+
+    def _write_setting(self, key, payload):
+        """
+        Send a setting to the camera, used by the settings queue.
+        """
+        return self._request(f"/settings/{key}", params={"set": payload})
+
     @inlineCallbacks
     def record(self, record=True, tag=None):
         """
@@ -501,7 +1003,7 @@ class Android_IPWebCam(VideoCamera):
         """
         Set the video scene mode.
         """
-        if scenemode not in self.available_settings["scenemode"]:
+        if not self.settings.is_available("scenemode", scenemode):
             raise YomboWarning(f"{scenemode} is not a valid scenemode")
 
         results = yield self.change_setting("scenemode", scenemode)
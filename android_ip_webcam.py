@@ -1,21 +1,127 @@
 """
 Brings images from Android IP Webcam into Yombo. This allows image capture and video streaming.
 
-The actual module doesn't do anything, it's all in the device.
+The devices do most of the work. This module owns the services shared by all the devices, such as the poll
+scheduler that keeps every camera's status fresh.
 
 :copyright: 2018-2019 Yombo
 :license: YRPL
 """
+from twisted.internet.defer import inlineCallbacks
 
 from yombo.core.module import YomboModule
 
+from . import fleet
+from .bulk import run_bulk
+from .scheduler import PollScheduler
+
 
 class Android_IP_WebCam(YomboModule):
     """
     Brings images from Android IP Webcam into Yombo. This allows image capture and video streaming.
     """
+    @inlineCallbacks
     def _init_(self, **kwargs):
         """
-        Setups all Android IP Cameras
+        Setups the poll scheduler and startup limits shared by all Android IP Cameras.
+        """
+        yield self.module_variables()
+        startup_concurrency = self.module_variable_value("startup_concurrency", None)
+        if startup_concurrency is not None:
+            fleet.set_startup_limit(startup_concurrency)
+        self.poll_scheduler = PollScheduler(
+            interval=self.module_variable_value("poll_interval", 30),
+            min_interval=self.module_variable_value("poll_min_interval", 5),
+            max_interval=self.module_variable_value("poll_max_interval", 600),
+        )
+        for device in fleet.DEVICES.values():
+            self.poll_scheduler.add(device)
+        fleet.poll_scheduler = self.poll_scheduler
+
+        try:
+            image_worker_mode = self.module_variables_cached["image_worker_mode"]["values"][0]
+        except (KeyError, IndexError):
+            image_worker_mode = "thread"
+        fleet.image_pool.configure(
+            workers=self.module_variable_value("image_workers", None),
+            mode="process" if str(image_worker_mode).lower().startswith("process") else "thread",
+        )
+        fleet.thumbnail_cache.max_bytes = int(self.module_variable_value("thumbnail_cache_mb", 32) * 1024 * 1024)
+        self.bulk_concurrency = int(self.module_variable_value("bulk_concurrency", 32))
+        fleet.host_limiter.rate = float(self.module_variable_value("bulk_host_rate", 10))
+
+    def _start_(self, **kwargs):
+        """
+        Start polling the cameras.
+        """
+        self.poll_scheduler.start()
+
+    def _stop_(self, **kwargs):
+        """
+        Stop polling the cameras.
+        """
+        self.poll_scheduler.stop()
+        fleet.image_pool.shutdown()
+
+    def bulk_command(self, command, *args, selector=None, concurrency=None, **kwargs):
+        """
+        Run a command on all the matching cameras at the same time, such as turning on every torch:
+
+            results = yield module.bulk_command("set_light", True, selector="garage_*")
+
+        :param command: Device method name, such as "set_light", "record" or "change_setting".
+        :param selector: None for every camera, a callable given each device, a glob matched against the
+            device id and machine label, or a list of device ids and machine labels.
+        :param concurrency: Most commands in progress at once, defaults to the bulk_concurrency variable.
+        :return: Deferred that fires with each camera's result and timing, and the totals.
+        """
+        return run_bulk(fleet.select(selector), command, args, kwargs,
+                        concurrency=concurrency or getattr(self, "bulk_concurrency", 32),
+                        limiter=fleet.host_limiter)
+
+    def module_variable_value(self, name, default):
+        """
+        Get a numeric module variable, returning default if it's not set or not a number.
+
+        :param name: Variable name.
+        :param default: Value to use if the variable isn't set.
+        """
+        try:
+            return float(self.module_variables_cached[name]["values"][0])
+        except (KeyError, IndexError, TypeError, ValueError):
+            return default
+
+    @property
+    def poll_stats(self):
+        """
+        Returns the effective poll interval and poll lag for every camera.
+        """
+        return self.poll_scheduler.stats
+
+    @property
+    def image_pool_stats(self):
+        """
+        Returns the image worker pool's queue, drop and per-worker utilization statistics.
+        """
+        return fleet.image_pool.stats
+
+    @property
+    def thumbnail_stats(self):
+        """
+        Returns the size and hit rate of the resized snapshot cache shared by all cameras.
+        """
+        return fleet.thumbnail_cache.stats
+
+    def prometheus_metrics(self):
+        """
+        Returns the request latency, error and sensor metrics of every camera in the Prometheus text
+        exposition format, for a scrape endpoint or a push gateway.
+        """
+        return fleet.prometheus_metrics()
+
+    @property
+    def startup_stats(self):
+        """
+        Returns how long startup took to get all cameras available, and the ramp's CPU and memory use.
         """
-        pass
+        return fleet.startup_stats()
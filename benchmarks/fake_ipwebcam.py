@@ -0,0 +1,265 @@
+"""
+A stand-in for the IP Webcam app, for benchmarks and trying the module without phones.
+
+Serves the endpoints the module uses: /status.json, /sensors.json, /shot.jpg, /video (MJPEG), /audio.wav,
+/settings/*, /enabletorch, /disabletorch, /focus, /nofocus, /startvideo, /stopvideo and /ptz. Responses can be
+delayed by a fixed latency plus random jitter, and a fraction of requests can fail with a 500 or by dropping
+the connection.
+
+Run one fake camera per port:
+
+    python benchmarks/fake_ipwebcam.py --port 18080 --count 20 --latency 0.02 --jitter 0.01 --failure-rate 0.01
+
+Or use FakeCamera from another script, see benchmarks/fleet_load.py.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+import argparse
+from io import BytesIO
+import json
+import math
+import os
+import random
+from struct import pack
+import sys
+from time import time
+
+from twisted.internet import reactor
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET, Site
+
+BOUNDARY = b"Ba4oTvQMY8ew04N8dcnM"
+
+VIDEO_SIZES = ["1920x1080", "1280x720", "960x720", "800x480", "640x480", "320x240"]
+
+
+def make_jpeg(size, width=640, height=480, seed=0):
+    """
+    Make a JPEG of roughly size bytes. Uses Pillow when installed so the frames can be decoded, otherwise a
+    minimal header followed by filler bytes.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    if Image is not None:
+        noise = random.Random(seed).randbytes(width * height * 3) if hasattr(random.Random, "randbytes") \
+            else os.urandom(width * height * 3)
+        image = Image.frombytes("RGB", (width, height), noise)
+        low, high = 5, 95
+        data = b""
+        while low <= high:  # Find the quality that's closest to the wanted size.
+            quality = (low + high) // 2
+            output = BytesIO()
+            image.save(output, "JPEG", quality=quality)
+            data = output.getvalue()
+            if len(data) > size:
+                high = quality - 1
+            else:
+                low = quality + 1
+        return data
+    sof = b"\xff\xc0" + pack(">HBHHB", 11, 8, height, width, 1) + b"\x01\x11\x00"
+    filler = os.urandom(max(0, size - len(sof) - 6)).replace(b"\xff", b"\x00")
+    return b"\xff\xd8" + sof + filler + b"\xff\xd9"
+
+
+class Options(object):
+    """
+    Behaviour of a fake camera.
+
+    :param latency: Seconds added before each response.
+    :param jitter: Up to this many seconds are randomly added to the latency.
+    :param failure_rate: Fraction of requests that fail.
+    :param frame_size: Approximate JPEG size in bytes.
+    :param fps: Frames per second on /video.
+    """
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, frame_size=60000, fps=15):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.frame_size = frame_size
+        self.fps = fps
+
+
+class FakeCamera(Resource):
+    """
+    One fake phone. Keeps its settings, so settings changes show up in later /status.json responses.
+    """
+    isLeaf = True
+
+    def __init__(self, options, seed=0):
+        super().__init__()
+        self.options = options
+        self.random = random.Random(seed)
+        self.frames = [make_jpeg(options.frame_size, seed=seed * 10 + index) for index in range(4)]
+        self.started = time()
+        self.requests = 0
+        self.failures = 0
+        self.video_connections = 0
+        self.audio_connections = 0
+        self.curvals = {
+            "quality": "70", "video_size": "1280x720", "night_vision": "off", "orientation": "landscape",
+            "torch": "off", "focus": "on", "zoom": "100", "scenemode": "auto", "overlay": "off",
+            "ffc": "off", "gps_active": "off", "motion_detect": "off", "video_recording": "off",
+        }
+        self.avail = {
+            "video_size": VIDEO_SIZES,
+            "orientation": ["landscape", "upsidedown", "portrait", "upsidedown_portrait"],
+            "scenemode": ["auto", "night", "sports", "party"],
+            "night_vision": ["on", "off"],
+        }
+
+    def render_GET(self, request):
+        self.requests += 1
+        delay = self.options.latency + self.random.uniform(0, self.options.jitter)
+        if self.random.random() < self.options.failure_rate:
+            self.failures += 1
+            if self.random.random() < 0.5:
+                request.setResponseCode(500)
+                reactor.callLater(delay, self._finish, request, b"Internal error")
+            else:
+                reactor.callLater(delay, request.transport.abortConnection)
+            return NOT_DONE_YET
+
+        path = request.path.decode()
+        if path == "/video":
+            reactor.callLater(delay, self._start_video, request)
+        elif path == "/audio.wav":
+            reactor.callLater(delay, self._start_audio, request)
+        else:
+            content_type, body = self._response(path, request.args)
+            request.setHeader(b"Content-Type", content_type)
+            reactor.callLater(delay, self._finish, request, body)
+        return NOT_DONE_YET
+
+    def _finish(self, request, body):
+        if request.finished or request._disconnected:
+            return
+        request.setHeader(b"Content-Length", str(len(body)).encode())
+        request.write(body)
+        request.finish()
+
+    def _response(self, path, args):
+        if path == "/status.json":
+            status = {
+                "video_connections": self.video_connections,
+                "audio_connections": self.audio_connections,
+                "curvals": self.curvals,
+            }
+            if args.get(b"show_avail"):
+                status["avail"] = self.avail
+            return b"application/json", json.dumps(status).encode()
+        if path == "/sensors.json":
+            return b"application/json", json.dumps(self._sensors(args)).encode()
+        if path == "/shot.jpg":
+            return b"image/jpeg", self.random.choice(self.frames)
+        if path.startswith("/settings/"):
+            key = path[len("/settings/"):]
+            if key == "ptz" and b"zoom" in args:
+                self.curvals["zoom"] = args[b"zoom"][0].decode()
+            elif b"set" in args:
+                self.curvals[key] = args[b"set"][0].decode()
+            return b"text/plain", b"Ok"
+        if path in ("/enabletorch", "/disabletorch"):
+            self.curvals["torch"] = "on" if path == "/enabletorch" else "off"
+        elif path in ("/focus", "/nofocus"):
+            self.curvals["focus"] = "on" if path == "/focus" else "off"
+        elif path in ("/startvideo", "/stopvideo"):
+            self.curvals["video_recording"] = "on" if path == "/startvideo" else "off"
+        return b"text/plain", b"Ok"
+
+    def _sensors(self, args):
+        now = int(time() * 1000)
+        since = int(args.get(b"from", [b"0"])[0] or 0)
+        wanted = set(args.get(b"sense", [b""])[0].decode().split(",")) - {""}
+        sensors = {
+            "battery_level": ("%", lambda t: [80.0]),
+            "light": ("lx", lambda t: [200 + 50 * math.sin(t / 10000)]),
+            "accel": ("m/s2", lambda t: [math.sin(t / 700), math.cos(t / 900), 9.8]),
+            "sound": ("dB", lambda t: [40 + 5 * math.sin(t / 3000)]),
+        }
+        results = {}
+        for name, (unit, value) in sensors.items():
+            if wanted and name not in wanted:
+                continue
+            timestamps = [now - step * 200 for step in range(20, -1, -1)]
+            results[name] = {"unit": unit, "data": [[t, value(t)] for t in timestamps if t > since]}
+        return results
+
+    def _start_video(self, request):
+        request.setHeader(b"Content-Type", b"multipart/x-mixed-replace;boundary=" + BOUNDARY)
+        self.video_connections += 1
+        request.notifyFinish().addBoth(self._video_closed)
+        self._send_frame(request, 0)
+
+    def _video_closed(self, result):
+        self.video_connections -= 1
+
+    def _send_frame(self, request, index):
+        if request.finished or request._disconnected:
+            return
+        frame = self.frames[index % len(self.frames)]
+        request.write(b"--" + BOUNDARY + b"\r\nContent-Type: image/jpeg\r\nContent-Length: " +
+                      str(len(frame)).encode() + b"\r\n\r\n" + frame + b"\r\n")
+        interval = 1 / self.options.fps + self.random.uniform(-self.options.jitter, self.options.jitter)
+        reactor.callLater(max(0.0, interval), self._send_frame, request, index + 1)
+
+    def _start_audio(self, request):
+        request.setHeader(b"Content-Type", b"audio/wav")
+        self.audio_connections += 1
+        request.notifyFinish().addBoth(self._audio_closed)
+        rate = 8000
+        request.write(b"RIFF" + pack("<I", 0xFFFFFFFF) + b"WAVE" +
+                      b"fmt " + pack("<IHHIIHH", 16, 1, 1, rate, rate * 2, 2, 16) +
+                      b"data" + pack("<I", 0xFFFFFFFF))
+        self._send_audio(request, rate, 0)
+
+    def _audio_closed(self, result):
+        self.audio_connections -= 1
+
+    def _send_audio(self, request, rate, sample):
+        if request.finished or request._disconnected:
+            return
+        count = rate // 10
+        amplitude = 3000 if (sample // (rate * 5)) % 2 else 300  # Loud and quiet five second stretches.
+        samples = [int(amplitude * math.sin(2 * math.pi * 440 * (sample + i) / rate)) for i in range(count)]
+        request.write(pack(f"<{count}h", *samples))
+        reactor.callLater(0.1, self._send_audio, request, rate, sample + count)
+
+
+def listen(options, port, count=1, interface="127.0.0.1"):
+    """
+    Start count fake cameras on consecutive ports.
+
+    :return: List of (port, FakeCamera) tuples.
+    """
+    cameras = []
+    for index in range(count):
+        camera = FakeCamera(options, seed=index)
+        reactor.listenTCP(port + index, Site(camera), interface=interface)
+        cameras.append((port + index, camera))
+    return cameras
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=18080, help="First port, default 18080.")
+    parser.add_argument("--count", type=int, default=1, help="Number of cameras, on consecutive ports.")
+    parser.add_argument("--interface", default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to each response.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many random seconds added.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests that fail.")
+    parser.add_argument("--frame-size", type=int, default=60000, help="JPEG size in bytes, default 60000.")
+    parser.add_argument("--fps", type=float, default=15, help="Frames per second on /video, default 15.")
+    args = parser.parse_args()
+
+    options = Options(args.latency, args.jitter, args.failure_rate, args.frame_size, args.fps)
+    cameras = listen(options, args.port, args.count, args.interface)
+    print(f"Serving {len(cameras)} fake IP Webcam(s) on {args.interface}:{args.port}-{args.port + args.count - 1}")
+    sys.stdout.flush()
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()
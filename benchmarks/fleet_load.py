@@ -0,0 +1,327 @@
+"""
+Load test the module against fake IP Webcams.
+
+Starts N fake cameras (benchmarks/fake_ipwebcam.py) in a separate process, creates an Android_IPWebCam device
+for each, and for --duration seconds drives update(), camera_image() and change_setting() on every device,
+with the in process motion and noise sensors running if --sensors is given. Reports requests per second,
+p50/p99 latency of each operation, the sensors' frame rates, and the CPU and memory used by this process.
+
+    python benchmarks/fleet_load.py --devices 20 --duration 30 --latency 0.02 --jitter 0.01 --sensors
+
+The devices are real Android_IPWebCam instances. Only the gateway services they use are replaced: the HTTP
+requests library (with a twisted Agent), child device creation and the device variables. Yombo must be
+importable, so run this with the gateway's Python and PYTHONPATH.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+import argparse
+import base64
+import json
+import os
+from random import uniform
+import subprocess
+import sys
+import tempfile
+from time import time
+from urllib.parse import urlencode
+import warnings
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, succeed
+from twisted.internet.task import deferLater
+from twisted.web.client import Agent, readBody
+from twisted.web.http_headers import Headers
+
+# The HTTP/1.1 client's transports trigger this when reading bodies, it doesn't affect the results.
+warnings.filterwarnings("ignore", message="Using readBody with a transport")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = "android_ip_webcam"
+
+
+class BenchRequests(object):
+    """
+    Stand-in for the gateway's requests library: returns the same results dictionary, also for HTTP error
+    statuses, and raises YomboWarning when the request itself fails.
+    """
+    def __init__(self, timeout, warning):
+        self.timeout = timeout
+        self.warning = warning
+
+    def request(self, method, url, auth=None, pool=None, params=None, **kwargs):
+        if params:
+            url = f"{url}?{urlencode(params)}"
+        headers = Headers()
+        if auth:
+            headers.addRawHeader(b"Authorization", b"Basic " + base64.b64encode(f"{auth[0]}:{auth[1]}".encode()))
+        agent = Agent(reactor, connectTimeout=self.timeout, pool=pool)
+        d = agent.request(method.upper().encode(), url.encode(), headers)
+        d.addTimeout(self.timeout, reactor)
+        d.addCallback(self._received)
+        d.addErrback(self._failed)
+        return d
+
+    @inlineCallbacks
+    def _received(self, response):
+        body = yield readBody(response)
+        headers = {name.decode().lower(): [value.decode() for value in values]
+                   for name, values in response.headers.getAllRawHeaders()}
+        content_type = headers.get("content-type", [""])[0]
+        if "json" in content_type:
+            content = json.loads(body)
+        elif content_type.startswith("text/"):
+            content = body.decode()
+        else:
+            content = body
+        return {"response": response, "headers": headers, "content": content, "content_raw": body}
+
+    def _failed(self, failure):
+        if failure.check(self.warning):
+            return failure
+        raise self.warning(failure.getErrorMessage()) from failure.value
+
+
+class BenchChildDevice(object):
+    """
+    Motion and noise child device.
+    """
+    def __init__(self):
+        self.FEATURES = {}
+        self.MACHINE_STATUS_EXTRA_FIELDS = {}
+        self.status_changes = 0
+
+    def set_status(self, **kwargs):
+        self.status_changes += 1
+
+
+class BenchDevices(object):
+    def create_child_device(self, parent, **kwargs):
+        return succeed(BenchChildDevice())
+
+
+def camera_class(device_class):
+    """
+    Subclass the module's device with the gateway services replaced.
+    """
+    class BenchCamera(device_class):
+        def __init__(self, port, variables, requests):
+            self.device_id = f"bench_{port}"
+            self.machine_label = f"bench_{port}"
+            self.device_variables_cached = {name: {"values": [value]} for name, value in variables.items()}
+            self._Requests = requests
+            self._Devices = BenchDevices()
+            self._bench_port = port
+            self._request_auth = None
+            super().__init__()
+
+        @property
+        def base_url(self):
+            return f"http://127.0.0.1:{self._bench_port}"
+
+        @property
+        def request_auth(self):
+            return self._request_auth
+
+        def device_variables(self):
+            return succeed(self.device_variables_cached)
+
+    return BenchCamera
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def process_usage():
+    """
+    Returns (cpu seconds, rss in MB, peak rss in MB).
+    """
+    if resource is None:
+        return 0.0, None, None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    peak = usage.ru_maxrss / (1048576 if sys.platform == "darwin" else 1024)
+    rss = None
+    try:
+        with open("/proc/self/statm") as statm:
+            rss = int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1048576
+    except (OSError, ValueError):
+        pass
+    return usage.ru_utime + usage.ru_stime, rss, peak
+
+
+class LoadRun(object):
+    """
+    Drives the operations on every device and collects their latencies.
+    """
+    def __init__(self, devices, args):
+        self.devices = devices
+        self.args = args
+        self.latencies = {"update": [], "camera_image": [], "change_setting": []}
+        self.failures = {"update": 0, "camera_image": 0, "change_setting": 0}
+        self.running = True
+
+    @inlineCallbacks
+    def loop(self, name, interval, operation):
+        # Spread the devices across the interval so they don't all fire at once.
+        yield deferLater(reactor, uniform(0, interval), lambda: None)
+        while self.running:
+            start = time()
+            try:
+                yield operation()
+                self.latencies[name].append(time() - start)
+            except Exception:
+                self.failures[name] += 1
+            yield deferLater(reactor, max(0.0, interval - (time() - start)), lambda: None)
+
+    def start(self):
+        args = self.args
+        for device in self.devices:
+            if args.update_interval > 0:
+                self.loop("update", args.update_interval, device.update)
+            if args.image_interval > 0:
+                if args.thumbnail:
+                    self.loop("camera_image", args.image_interval,
+                              lambda device=device: device.camera_image(width=args.thumbnail))
+                else:
+                    self.loop("camera_image", args.image_interval, device.camera_image)
+            if args.setting_interval > 0:
+                state = {"value": False}
+
+                def toggle(device=device, state=state):
+                    state["value"] = not state["value"]
+                    return device.change_setting("night_vision", state["value"])
+                self.loop("change_setting", args.setting_interval, toggle)
+
+    def stop(self):
+        self.running = False
+
+
+def report(run, devices, fleet, seconds, cpu_seconds, rss, peak_rss):
+    requests = sum(endpoint.requests for device in devices for endpoint in device.metrics.endpoints.values())
+    errors = sum(endpoint.errors for device in devices for endpoint in device.metrics.endpoints.values())
+    print(f"\n{len(devices)} devices, {seconds:.1f} seconds")
+    print(f"HTTP requests    {requests / seconds:10.1f} req/s   ({requests} requests, {errors} errors)")
+    for name, values in run.latencies.items():
+        if not values and not run.failures[name]:
+            continue
+        p50, p99 = percentile(values, 0.5), percentile(values, 0.99)
+        print(f"{name:<16} {len(values) / seconds:10.1f} ops/s   p50 {(p50 or 0) * 1000:8.1f} ms   "
+              f"p99 {(p99 or 0) * 1000:8.1f} ms   ({run.failures[name]} failed)")
+    for sensor in ("motion", "noise"):
+        rates = [device.sensor_meters[sensor].rate for device in devices
+                 if sensor in device.sensor_meters and device.sensor_meters[sensor].rate]
+        if rates:
+            print(f"{sensor + ' sensor':<16} {sum(rates) / len(rates):10.1f} per second per device")
+    frames = sum(device.frame_hub.sequence for device in devices)
+    if frames:
+        print(f"video frames     {frames / seconds:10.1f} frames/s received")
+    print(f"CPU              {cpu_seconds / seconds * 100:10.1f} %   ({cpu_seconds:.2f} seconds)")
+    if rss is not None:
+        print(f"RSS              {rss:10.1f} MB   (peak {peak_rss:.1f} MB)")
+    print(f"image workers    {fleet.image_pool.stats['completed']} jobs, {fleet.image_pool.stats['dropped']} dropped")
+
+
+def start_server(args):
+    command = [sys.executable, os.path.join(ROOT, "benchmarks", "fake_ipwebcam.py"), "--port", str(args.port),
+               "--count", str(args.devices), "--latency", str(args.latency), "--jitter", str(args.jitter),
+               "--failure-rate", str(args.failure_rate), "--frame-size", str(args.frame_size),
+               "--fps", str(args.fps)]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+    line = server.stdout.readline()
+    if not line.startswith("Serving"):
+        server.kill()
+        sys.exit("The fake IP Webcam server didn't start.")
+    return server
+
+
+@inlineCallbacks
+def run(args, server):
+    sys.path.insert(0, args.import_dir)
+    from yombo.core.exceptions import YomboWarning
+    from yombo.lib.devices.camera import VideoCamera
+    # The gateway's device base class needs a running gateway, the bench devices set what they use themselves.
+    VideoCamera.__init__ = lambda self, *args, **kwargs: None
+    package = __import__(PACKAGE, fromlist=["_devices", "fleet"])
+    fleet = package.fleet
+    BenchCamera = camera_class(package._devices.Android_IPWebCam)
+
+    variables = {
+        "host": "127.0.0.1", "port": 0, "username": "", "password": "",
+        "motion_enabled": args.sensors, "noise_enabled": args.sensors,
+        "snapshot_max_age": args.snapshot_max_age,
+    }
+    requests = BenchRequests(args.timeout, YomboWarning)
+    devices = [BenchCamera(args.port + index, variables, requests) for index in range(args.devices)]
+
+    started = time()
+    while len([device for device in devices if device._stream_key is not None]) < len(devices):
+        if time() - started > 60:
+            print("Not all devices finished loading, continuing.")
+            break
+        yield deferLater(reactor, 0.1, lambda: None)
+    print(f"{len(devices)} devices loaded in {time() - started:.2f} seconds")
+    yield deferLater(reactor, args.warmup, lambda: None)
+
+    for device in devices:  # Count only the measured period.
+        device.metrics.endpoints.clear()
+        device.frame_hub.sequence = 0
+    cpu_start = process_usage()[0]
+    load = LoadRun(devices, args)
+    measure_start = time()
+    load.start()
+    yield deferLater(reactor, args.duration, lambda: None)
+    load.stop()
+    seconds = time() - measure_start
+    cpu_seconds, rss, peak_rss = process_usage()
+    report(load, devices, fleet, seconds, cpu_seconds - cpu_start, rss, peak_rss)
+
+    for device in devices:
+        device._unload()
+    fleet.image_pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=10, help="Number of simulated cameras, default 10.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to measure, default 30.")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds to run before measuring, default 3.")
+    parser.add_argument("--port", type=int, default=18080, help="First fake camera port, default 18080.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake camera response latency in seconds.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Fake camera random extra latency.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of fake requests that fail.")
+    parser.add_argument("--frame-size", type=int, default=60000, help="JPEG size in bytes, default 60000.")
+    parser.add_argument("--fps", type=float, default=15, help="Fake video frames per second, default 15.")
+    parser.add_argument("--timeout", type=float, default=5, help="Request timeout, default 5.")
+    parser.add_argument("--update-interval", type=float, default=1, help="Seconds between update() calls.")
+    parser.add_argument("--image-interval", type=float, default=0.5,
+                        help="Seconds between camera_image() calls.")
+    parser.add_argument("--thumbnail", type=int, help="Ask camera_image() for this width.")
+    parser.add_argument("--snapshot-max-age", type=float, default=0,
+                        help="Snapshot cache age, default 0 so every camera_image() fetches a new image.")
+    parser.add_argument("--setting-interval", type=float, default=5,
+                        help="Seconds between change_setting() calls.")
+    parser.add_argument("--sensors", action="store_true", help="Run the motion and noise sensors.")
+    args = parser.parse_args()
+
+    server = start_server(args)
+    with tempfile.TemporaryDirectory() as directory:
+        os.symlink(ROOT, os.path.join(directory, PACKAGE))
+        args.import_dir = directory
+        d = run(args, server)
+        d.addErrback(lambda failure: failure.printTraceback())
+        d.addBoth(lambda _: reactor.callLater(0.5, reactor.stop))
+        reactor.run()
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
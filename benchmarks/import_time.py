@@ -0,0 +1,134 @@
+"""
+Measures how long the module takes to import, using python -X importtime.
+
+The module and its device file are imported in a fresh interpreter several times and the median is reported,
+along with the imports that took the longest. Modules the gateway has always loaded before this one (Twisted
+and the Yombo core) are imported first, so only this module's own cost is counted.
+
+Compare against an earlier commit with --baseline, the commit is exported with git archive:
+
+    python benchmarks/import_time.py --baseline HEAD~5
+
+Yombo must be importable, so run this with the gateway's Python and PYTHONPATH.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from statistics import median
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PRELOAD = [
+    "twisted.internet.reactor",
+    "twisted.internet.defer",
+    "twisted.web.client",
+    "yombo.core.log",
+    "yombo.core.module",
+    "yombo.lib.devices.camera",
+]
+
+
+def parse_importtime(output, package):
+    """
+    Parse -X importtime output.
+
+    :return: A tuple of (total microseconds for the package, {module: self microseconds}) where the modules
+        are the ones imported by the package.
+    """
+    total = 0
+    self_times = {}
+    nested = {}  # Modules imported since the last top level import, reported before their parent.
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            self_time, cumulative, name = line[len("import time:"):].split("|")
+            self_time, cumulative = int(self_time), int(cumulative)
+        except ValueError:
+            continue  # The header line.
+        depth = len(name) - len(name.lstrip())
+        name = name.strip()
+        nested[name] = self_time
+        if depth > 1:
+            continue
+        if name == package or name.startswith(package + "."):
+            total += cumulative
+            self_times.update(nested)
+        nested = {}
+    return total, self_times
+
+
+def measure(tree, package, preload, runs):
+    """
+    Import the package from tree runs times.
+
+    :return: A tuple of (list of total microseconds, {module: median self microseconds}).
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        os.symlink(tree, os.path.join(directory, package))
+        code = "".join(f"import {name}\n" for name in preload) + \
+            f"import {package}\nimport {package}._devices\n"
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [directory, env.get("PYTHONPATH")]))
+        totals = []
+        self_times = {}
+        for _ in range(runs):
+            result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env, cwd=directory,
+                                    stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, universal_newlines=True)
+            if result.returncode != 0:
+                sys.exit(f"Import failed:\n{result.stderr[-2000:]}")
+            total, times = parse_importtime(result.stderr, package)
+            totals.append(total)
+            for name, value in times.items():
+                self_times.setdefault(name, []).append(value)
+    return totals, {name: median(values) for name, values in self_times.items()}
+
+
+def export_tree(ref, directory):
+    """
+    Write the tree at a git ref to directory.
+    """
+    archive = subprocess.run(["git", "-C", ROOT, "archive", ref], stdout=subprocess.PIPE, check=True).stdout
+    subprocess.run(["tar", "-x", "-C", directory], input=archive, check=True)
+    return directory
+
+
+def report(label, totals):
+    print(f"{label:<12} median {median(totals) / 1000:8.1f} ms   min {min(totals) / 1000:8.1f} ms   "
+          f"({len(totals)} runs)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", help="Git ref to compare against, such as HEAD~1.")
+    parser.add_argument("--package", default="android_ip_webcam", help="Package name to import the module as.")
+    parser.add_argument("--runs", type=int, default=9, help="Imports to measure, default 9.")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list, default 10.")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="Don't import Twisted and the Yombo core first.")
+    args = parser.parse_args()
+    preload = [] if args.no_preload else PRELOAD
+
+    totals, self_times = measure(ROOT, args.package, preload, args.runs)
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as directory:
+            baseline_totals, _ = measure(export_tree(args.baseline, directory), args.package, preload, args.runs)
+        report(args.baseline, baseline_totals)
+    report("current", totals)
+    if args.baseline:
+        saved = median(baseline_totals) - median(totals)
+        print(f"{'saved':<12} {saved / 1000:8.1f} ms ({saved * 100 / max(median(baseline_totals), 1):.0f}%)")
+
+    print("\nSlowest imports (self time):")
+    slowest = sorted(((value, name) for name, value in self_times.items()), reverse=True)
+    for value, name in slowest[:args.top]:
+        print(f"  {value / 1000:8.2f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Microbenchmark for the MJPEG multipart parser.
+
+Feeds recorded multipart streams (or a generated one) through mjpeg.MultipartParser in fixed size reads, the way
+twisted delivers them, and reports MB/s and frames/s. A simple bytes concatenation and find() parser is run on the
+same data for comparison.
+
+Record a sample stream from a phone with:
+
+    curl -s http://phone:8080/video --output sample.mjpeg
+
+Then run:
+
+    python benchmarks/mjpeg_parser.py sample.mjpeg --boundary Ba4oTvQMY8ew04N8dcnM
+
+Without files, a stream of generated 1080p sized frames is used.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+import argparse
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mjpeg import MultipartParser, parse_part_headers  # noqa: E402
+
+
+class ConcatenatingParser(object):
+    """
+    Baseline parser: appends every read to a bytes buffer and searches it with find().
+    """
+    def __init__(self, boundary):
+        self.delimiter = b"--" + boundary.lstrip(b"-")
+        self.buffer = b""
+        self.content_type = None
+        self.length = None
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        while True:
+            if self.length is None:
+                start = self.buffer.find(self.delimiter)
+                end = self.buffer.find(b"\r\n\r\n", start)
+                if start == -1 or end == -1:
+                    break
+                self.content_type, self.length = parse_part_headers(self.buffer[start + len(self.delimiter):end])
+                self.buffer = self.buffer[end + 4:]
+            if self.length >= 0:
+                if len(self.buffer) < self.length:
+                    break
+                frames.append((self.content_type, self.buffer[:self.length]))
+                self.buffer = self.buffer[self.length:]
+            else:
+                end = self.buffer.find(self.delimiter)
+                if end == -1:
+                    break
+                frames.append((self.content_type, self.buffer[:end]))
+                self.buffer = self.buffer[end:]
+            self.length = None
+        return frames
+
+
+def generate_stream(boundary, frames, frame_size, content_length):
+    """
+    Build a multipart stream of random frames.
+    """
+    payload = os.urandom(frame_size).replace(b"--", b"-_")
+    parts = []
+    for _ in range(frames):
+        headers = b"Content-Type: image/jpeg\r\n"
+        if content_length:
+            headers += b"Content-Length: %d\r\n" % frame_size
+        parts.append(b"--" + boundary + b"\r\n" + headers + b"\r\n" + payload + b"\r\n")
+    return b"".join(parts) + b"--" + boundary + b"\r\n"
+
+
+def sniff_boundary(stream):
+    """
+    Use the first line of a recorded stream as the boundary.
+    """
+    first_line = stream[:stream.find(b"\r\n")]
+    return first_line.lstrip(b"-")
+
+
+def run(parser_class, stream, boundary, read_size, repeat):
+    """
+    Parse the stream repeat times, returns (seconds, frames).
+    """
+    best = None
+    frames = 0
+    for _ in range(repeat):
+        parser = parser_class(boundary)
+        frames = 0
+        started = perf_counter()
+        for offset in range(0, len(stream), read_size):
+            frames += len(parser.feed(stream[offset:offset + read_size]))
+        elapsed = perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, frames
+
+
+def report(name, label, stream, seconds, frames):
+    megabytes = len(stream) / 1048576
+    print(f"{name:<28} {label:<14} {megabytes / seconds:10.1f} MB/s {frames / seconds:10.1f} frames/s "
+          f"({frames} frames, {megabytes:.1f} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="Recorded multipart streams.")
+    parser.add_argument("--boundary", help="Stream boundary, defaults to the first line of each file.")
+    parser.add_argument("--read-size", type=int, default=65536, help="Bytes per read, default 65536.")
+    parser.add_argument("--frames", type=int, default=300, help="Generated frames, default 300.")
+    parser.add_argument("--frame-size", type=int, default=250000, help="Generated frame bytes, default 250000.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per parser, the best is reported.")
+    parser.add_argument("--no-baseline", action="store_true", help="Skip the concatenating parser.")
+    args = parser.parse_args()
+
+    streams = []
+    for path in args.files:
+        with open(path, "rb") as file:
+            stream = file.read()
+        boundary = args.boundary.encode() if args.boundary else sniff_boundary(stream)
+        streams.append((os.path.basename(path), stream, boundary))
+    if not streams:
+        boundary = b"Ba4oTvQMY8ew04N8dcnM"
+        for content_length in (True, False):
+            name = "generated, " + ("length" if content_length else "no length")
+            streams.append((name, generate_stream(boundary, args.frames, args.frame_size, content_length), boundary))
+
+    parsers = [("memoryview", MultipartParser)]
+    if not args.no_baseline:
+        parsers.append(("concatenate", ConcatenatingParser))
+    for name, stream, boundary in streams:
+        for label, parser_class in parsers:
+            seconds, frames = run(parser_class, stream, boundary, args.read_size, args.repeat)
+            report(name, label, stream, seconds, frames)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Run a command on many cameras at once.
+
+Site wide actions, such as turning on every torch, are sent to all the matching cameras at the same time
+instead of one after another, so they finish in about the time of the slowest camera. A concurrency gate
+bounds how many are in flight, and a per host rate limit keeps a burst of commands from flooding a single
+phone.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from fnmatch import fnmatchcase
+from time import time
+
+from twisted.internet import reactor
+from twisted.internet.defer import DeferredList, inlineCallbacks
+from twisted.internet.task import deferLater
+
+from yombo.core.exceptions import YomboWarning
+
+from .startup_gate import ConcurrencyGate
+
+# Device methods that can be sent in bulk.
+BULK_COMMANDS = frozenset((
+    "change_setting", "record", "set_focus", "set_front_facing_camera", "set_gps_active", "set_light",
+    "set_night_vision", "set_orientation", "set_overlay", "set_quality", "set_scenemode", "set_zoom",
+))
+
+
+def matches(device, selector):
+    """
+    Check if a device matches a selector.
+
+    :param device: Android_IPWebCam instance.
+    :param selector: None for every device, a callable that's given the device, a glob matched against the
+        device id and machine label such as "garage_*", or a list of device ids and machine labels.
+    """
+    if selector is None:
+        return True
+    if callable(selector):
+        return bool(selector(device))
+    names = (device.device_id, getattr(device, "machine_label", None))
+    if isinstance(selector, str):
+        return any(name is not None and fnmatchcase(name, selector) for name in names)
+    selector = set(selector)
+    return any(name in selector for name in names)
+
+
+class HostRateLimiter(object):
+    """
+    Spaces out commands to the same host: rate per second, allowing bursts of up to burst commands.
+
+    :param rate: Commands per second for each host, 0 or less for no limit.
+    :param burst: Commands that can start at once before the rate applies.
+    """
+    def __init__(self, rate=10, burst=5):
+        self.rate = float(rate)
+        self.burst = burst
+        self.next_time = {}
+        self.delayed = 0
+
+    def acquire(self, host):
+        """
+        Wait for the host's turn.
+
+        :return: Deferred that fires when the command may be sent.
+        """
+        if self.rate <= 0:
+            return deferLater(reactor, 0, lambda: None)
+        now = time()
+        interval = 1 / self.rate
+        start = max(now - (self.burst - 1) * interval, self.next_time.get(host, 0))
+        self.next_time[host] = start + interval
+        delay = start - now
+        if delay <= 0:
+            return deferLater(reactor, 0, lambda: None)
+        self.delayed += 1
+        return deferLater(reactor, delay, lambda: None)
+
+
+@inlineCallbacks
+def run_bulk(devices, command, args=(), kwargs=None, concurrency=32, limiter=None):
+    """
+    Call a command on every device, with at most concurrency in progress.
+
+    :param devices: List of Android_IPWebCam instances.
+    :param command: Name of a device method in BULK_COMMANDS.
+    :param args: Arguments for the command.
+    :param kwargs: Keyword arguments for the command.
+    :param concurrency: Most commands in progress at once.
+    :param limiter: HostRateLimiter, None for no per host limit.
+    :return: Dictionary with each device's success, result or error and seconds, and the totals.
+    """
+    if command not in BULK_COMMANDS:
+        raise YomboWarning(f"Unknown bulk command '{command}', use one of: {', '.join(sorted(BULK_COMMANDS))}")
+    kwargs = kwargs or {}
+    gate = ConcurrencyGate("bulk", limit=max(1, int(concurrency)))
+    delayed = 0 if limiter is None else limiter.delayed
+    started = time()
+    results = {}
+
+    @inlineCallbacks
+    def send(device):
+        device_start = time()
+        try:
+            if limiter is not None:
+                yield limiter.acquire(getattr(device, "_host", None) or device.base_url)
+                device_start = time()
+            result = yield getattr(device, command)(*args, **kwargs)
+        except Exception as e:
+            results[device.device_id] = {
+                "machine_label": getattr(device, "machine_label", None),
+                "success": False,
+                "error": str(e),
+                "seconds": round(time() - device_start, 4),
+            }
+            return
+        results[device.device_id] = {
+            "machine_label": getattr(device, "machine_label", None),
+            "success": result is not False and result is not None,
+            "result": result,
+            "seconds": round(time() - device_start, 4),
+        }
+
+    yield DeferredList([gate.run(send, device) for device in devices], consumeErrors=True)
+    succeeded = sum(1 for result in results.values() if result["success"])
+    return {
+        "command": command,
+        "devices": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "seconds": round(time() - started, 4),
+        "rate_limited": 0 if limiter is None else limiter.delayed - delayed,
+    }
@@ -0,0 +1,178 @@
+"""
+Change detection for the status and sensor polls.
+
+Each status.json and sensors.json response is first compared as a whole with the previous one, which is a
+fast C level dictionary comparison; an identical response is skipped. Otherwise the settings (curvals),
+connection counts and latest sensor values are compared with the previous poll, and listeners get one Change
+for each value that's different. Automation can then react to a change without comparing whole dictionaries
+on every poll.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from time import time
+
+from yombo.core.log import get_logger
+
+logger = get_logger("modules.android_ipwebcam.change_tracker")
+
+# The status.json keys reported in the "connections" section.
+CONNECTION_KEYS = ("video_connections", "audio_connections")
+
+
+def diff_values(old, new):
+    """
+    Compare two flat dictionaries.
+
+    :return: Dictionary of {key: (old value, new value)} for the keys that were added, removed or changed. A
+        missing value is None.
+    """
+    changes = {}
+    for key, value in new.items():
+        if key not in old or old[key] != value:
+            changes[key] = (old.get(key), value)
+    for key in old.keys() - new.keys():
+        changes[key] = (old[key], None)
+    return changes
+
+
+class Change(object):
+    """
+    One value that changed between polls.
+
+    :param section: "curvals", "connections" or "sensors".
+    :param key: Setting, connection or sensor name, such as "quality" or "battery_level".
+    :param old: Previous value, None if it wasn't reported before.
+    :param new: Current value, None if it's no longer reported. Sensor values are tuples.
+    """
+    __slots__ = ("section", "key", "old", "new", "timestamp")
+
+    def __init__(self, section, key, old, new, timestamp=None):
+        self.section = section
+        self.key = key
+        self.old = old
+        self.new = new
+        self.timestamp = time() if timestamp is None else timestamp
+
+    def __repr__(self):
+        return f"Change({self.section}.{self.key}: {self.old!r} -> {self.new!r})"
+
+
+class ChangeTracker(object):
+    """
+    Keeps the previous poll's values for one camera and tells listeners what changed.
+
+    :param device: Android_IPWebCam instance, passed to the listeners.
+    """
+    def __init__(self, device):
+        self.device = device
+        self.listeners = []
+        self.curvals = {}
+        self.connections = {}
+        self.sensors = {}
+        self._status_data = None
+        self._sensor_data = None
+        self.polls = 0
+        self.unchanged = 0
+        self.changes = 0
+        self.last_change = None
+
+    def add_listener(self, callback, sections=None, keys=None):
+        """
+        Call callback(device, changes) with a list of Change instances after a poll finds changes.
+
+        :param callback: Function to call.
+        :param sections: Only these sections, such as ("curvals",), None for all.
+        :param keys: Only these keys, such as ("torch", "battery_level"), None for all.
+        """
+        self.listeners.append((
+            callback,
+            None if sections is None else frozenset(sections),
+            None if keys is None else frozenset(keys),
+        ))
+
+    def remove_listener(self, callback):
+        """
+        Stop calling a callback added with add_listener.
+        """
+        self.listeners = [listener for listener in self.listeners if listener[0] != callback]
+
+    def status_updated(self, status_data):
+        """
+        Compare a status.json response with the previous one.
+
+        :param status_data: Decoded status.json response.
+        :return: List of Change instances, None if the response is identical to the previous one.
+        """
+        self.polls += 1
+        if status_data == self._status_data:
+            self.unchanged += 1
+            return None
+        self._status_data = status_data
+
+        curvals = dict(status_data.get("curvals") or {})
+        connections = {key: status_data[key] for key in CONNECTION_KEYS if key in status_data}
+        changes = self._changes("curvals", diff_values(self.curvals, curvals))
+        changes += self._changes("connections", diff_values(self.connections, connections))
+        self.curvals = curvals
+        self.connections = connections
+        self._emit(changes)
+        return changes
+
+    def sensors_updated(self, sensor_data, sensor_store):
+        """
+        Compare the latest sensor values with the previous poll's, after a sensors.json response has been
+        merged into the sensor store. Only the sensors in the response are compared.
+
+        :param sensor_data: Decoded sensors.json response.
+        :param sensor_store: SensorStore the response was merged into.
+        :return: List of Change instances, None if the response is identical to the previous one.
+        """
+        if sensor_data == self._sensor_data:
+            return None
+        self._sensor_data = sensor_data
+
+        latest = {}
+        for name in sensor_data:
+            series = sensor_store.get(name)
+            if series is not None and series.latest is not None:
+                latest[name] = series.latest[1]
+        changes = self._changes("sensors", {
+            name: (self.sensors.get(name), value) for name, value in latest.items() if self.sensors.get(name) != value
+        })
+        self.sensors.update(latest)
+        self._emit(changes)
+        return changes
+
+    @staticmethod
+    def _changes(section, differences):
+        now = time()
+        return [Change(section, key, old, new, now) for key, (old, new) in differences.items()]
+
+    def _emit(self, changes):
+        if not changes:
+            return
+        self.changes += len(changes)
+        self.last_change = changes[-1].timestamp
+        for callback, sections, keys in list(self.listeners):
+            wanted = [change for change in changes
+                      if (sections is None or change.section in sections) and (keys is None or change.key in keys)]
+            if not wanted:
+                continue
+            try:
+                callback(self.device, wanted)
+            except Exception as e:
+                logger.warn("Change listener raised an error: {error}", error=e)
+
+    @property
+    def stats(self):
+        """
+        Returns counts used for debug data.
+        """
+        return {
+            "polls": self.polls,
+            "unchanged": self.unchanged,
+            "changes": self.changes,
+            "last_change": self.last_change,
+            "listeners": len(self.listeners),
+        }
@@ -0,0 +1,189 @@
+"""
+Circuit breaker for a camera's HTTP requests.
+
+When a phone drops off the network, every request would otherwise wait for the full timeout. After
+failure_threshold requests in a row fail, the breaker opens and requests fail immediately. After reset_timeout
+seconds it goes half open and sends one cheap probe request; if that works the breaker closes, otherwise it
+opens again and waits twice as long before the next probe, up to max_reset_timeout.
+
+Only failures to reach the phone count: connection errors, timeouts and cancelled requests. An HTTP error
+status, such as a 404 from a phone without a zoom lens, shows the phone is up and answering.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from time import time
+
+from twisted.internet import reactor
+from twisted.internet.defer import CancelledError, maybeDeferred
+from twisted.internet.error import ConnectError, ConnectionLost, DNSLookupError, TimeoutError as TwistedTimeout
+from twisted.web.client import RequestTransmissionFailed, ResponseFailed
+
+from yombo.core.exceptions import YomboWarning
+from yombo.core.log import get_logger
+
+logger = get_logger("modules.android_ipwebcam.circuit_breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Errors that mean the phone couldn't be reached.
+UNREACHABLE_ERRORS = (CancelledError, ConnectError, ConnectionLost, DNSLookupError, TwistedTimeout,
+                      RequestTransmissionFailed, ResponseFailed, ConnectionError, TimeoutError)
+
+
+def is_unreachable(error):
+    """
+    Check if a request error means the phone couldn't be reached, as opposed to it answering with an HTTP
+    error status.
+
+    The gateway's requests library raises YomboWarning for transport errors, so the exception chain is
+    searched for the original error. A YomboWarning without one is counted, errors carrying an HTTP response
+    never are.
+
+    :param error: The exception.
+    :return: True if it should count as a breaker failure.
+    """
+    while error is not None:
+        if isinstance(error, UNREACHABLE_ERRORS):
+            return True
+        if getattr(error, "response", None) is not None:
+            return False
+        cause = error.__cause__ or error.__context__
+        if cause is None:
+            return isinstance(error, YomboWarning)
+        error = cause
+    return False
+
+
+class CircuitBreaker(object):
+    """
+    Tracks request failures for one camera.
+
+    :param name: Used in log messages.
+    :param probe: Callable returning a deferred that fires if the camera is reachable, errbacks if not.
+    :param failure_threshold: Failures in a row that open the breaker.
+    :param reset_timeout: Seconds to wait before the first probe.
+    :param max_reset_timeout: Longest wait between probes.
+    :param recovered: Optional callable, called when the breaker closes after being open.
+    """
+    def __init__(self, name, probe, failure_threshold=3, reset_timeout=10, max_reset_timeout=300,
+                 recovered=None):
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.recovered = recovered
+
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.fast_failures = 0
+        self.probes = 0
+        self.opened_at = None
+        self._probe_call = None
+
+    def configure(self, failure_threshold, reset_timeout):
+        """
+        Apply new settings, used when the device is edited.
+        """
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.base_reset_timeout = reset_timeout
+        if self.state == CLOSED:
+            self.reset_timeout = reset_timeout
+
+    def allow(self):
+        """
+        Check if a request may be sent. Counts a fast failure when it can't.
+
+        :return: True if the breaker is closed.
+        """
+        if self.state == CLOSED:
+            return True
+        self.fast_failures += 1
+        return False
+
+    def success(self):
+        """
+        Record a successful request.
+        """
+        self.failures = 0
+        if self.state != CLOSED:
+            self._close()
+
+    def failure(self):
+        """
+        Record a failed request, opening the breaker if there have been too many in a row.
+        """
+        self.failures += 1
+        if self.state == CLOSED and self.failures >= self.failure_threshold:
+            self.trips += 1
+            logger.info("IP Webcam {name} is unreachable, failing requests for {seconds}s.",
+                        name=self.name, seconds=self.reset_timeout)
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time()
+        self._cancel_probe()
+        self._probe_call = reactor.callLater(self.reset_timeout, self._send_probe)
+
+    def _close(self):
+        self._cancel_probe()
+        was_open = self.state != CLOSED
+        self.state = CLOSED
+        self.failures = 0
+        self.reset_timeout = self.base_reset_timeout
+        if was_open:
+            logger.info("IP Webcam {name} is reachable again.", name=self.name)
+            if self.recovered is not None:
+                self.recovered()
+
+    def _send_probe(self):
+        self._probe_call = None
+        self.state = HALF_OPEN
+        self.probes += 1
+        maybeDeferred(self.probe).addCallbacks(self._probe_succeeded, self._probe_failed)
+
+    def _probe_succeeded(self, results):
+        if self.state == HALF_OPEN:
+            self._close()
+
+    def _probe_failed(self, failure):
+        if self.state != HALF_OPEN:
+            return
+        if not is_unreachable(failure.value):  # It answered, even if with an error.
+            self._close()
+            return
+        self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+        self._open()
+
+    def _cancel_probe(self):
+        if self._probe_call is not None and self._probe_call.active():
+            self._probe_call.cancel()
+        self._probe_call = None
+
+    def close(self):
+        """
+        Stop probing, used when the device is unloaded.
+        """
+        self._cancel_probe()
+
+    @property
+    def stats(self):
+        """
+        Returns a dictionary of breaker state, used for debug data.
+        """
+        return {
+            "state": self.state,
+            "failures_in_a_row": self.failures,
+            "trips": self.trips,
+            "fast_failures": self.fast_failures,
+            "probes": self.probes,
+            "opened_at": self.opened_at,
+            "next_probe_in": None if self._probe_call is None or not self._probe_call.active()
+            else round(self._probe_call.getTime() - reactor.seconds(), 1),
+        }
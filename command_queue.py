@@ -0,0 +1,132 @@
+"""
+Debounced setting writes for an Android IP Webcam.
+
+Setting changes are collected for a short debounce window before being sent to the phone. Repeated writes to
+the same setting within the window collapse into the last value, and writes that match what the phone already
+reports are skipped. Each caller still gets a deferred that fires when the write that took effect completes.
+
+Completed writes are remembered until a status poll sent after them has answered, so a poll that was already
+on its way during a write can't make the queue forget it.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, maybeDeferred, succeed
+from twisted.python.failure import Failure
+
+
+class SettingsCommandQueue(object):
+    """
+    Per-device queue of pending setting writes.
+
+    :param send: Callable that takes (key, payload) and returns a deferred with the result of the write.
+    :param current_value: Callable that takes a key and returns the phone's raw value for it, or None.
+    :param debounce: Seconds to wait for more writes before sending.
+    """
+    def __init__(self, send, current_value, debounce=0.1):
+        self.send = send
+        self.current_value = current_value
+        self.debounce = debounce
+        self.pending = {}  # key -> [payload, [deferreds]]
+        self.last_write = 0
+        self.sent = 0
+        self.collapsed = 0
+        self.skipped = 0
+        self._written = {}  # key -> (payload, write number)
+        self._writes_completed = 0
+        self._in_flight = set()
+        self._flush_call = None
+
+    def set(self, key, payload):
+        """
+        Queue a setting write.
+
+        :param key: Setting name, such as "quality".
+        :param payload: Value to send, already converted for the phone ("on"/"off" for booleans).
+        :return: Deferred that fires with the result of the effective write.
+        """
+        d = Deferred()
+        if key in self.pending:
+            self.collapsed += 1
+            self.pending[key][0] = payload
+            self.pending[key][1].append(d)
+            return d
+
+        if key not in self._in_flight and self._same_as_current(key, payload):
+            self.skipped += 1
+            return succeed(True)
+
+        self.pending[key] = [payload, [d]]
+        self._schedule_flush()
+        return d
+
+    def poll_started(self):
+        """
+        Called when a status request is sent to the phone.
+
+        :return: Value to give to settings_updated() when the response arrives.
+        """
+        return self._writes_completed
+
+    def settings_updated(self, poll=None):
+        """
+        Called when a new status has been received from the phone. It reflects the writes that completed
+        before the request was sent, which no longer need remembering.
+
+        :param poll: The value poll_started() returned when the request was sent, None to forget all writes.
+        """
+        if poll is None:
+            self._written.clear()
+            return
+        for key, (payload, number) in list(self._written.items()):
+            if number <= poll:
+                del self._written[key]
+
+    def _same_as_current(self, key, payload):
+        if key in self._written:
+            current = self._written[key][0]
+        else:
+            current = self.current_value(key)
+        return current is not None and str(current) == str(payload)
+
+    def _schedule_flush(self):
+        if self._flush_call is None or not self._flush_call.active():
+            self._flush_call = reactor.callLater(self.debounce, self._flush)
+
+    def _flush(self):
+        self._flush_call = None
+        for key in list(self.pending):
+            if key in self._in_flight:  # Keep writes to the same setting in order.
+                continue
+            payload, waiters = self.pending.pop(key)
+            self._in_flight.add(key)
+            self.sent += 1
+            self.last_write = reactor.seconds()
+            maybeDeferred(self.send, key, payload).addBoth(self._sent, key, payload, waiters)
+
+    def _sent(self, results, key, payload, waiters):
+        self._in_flight.discard(key)
+        failed = isinstance(results, Failure)
+        if not failed and results:
+            self._writes_completed += 1
+            self._written[key] = (payload, self._writes_completed)
+        for waiter in waiters:
+            if failed:
+                waiter.errback(results)
+            else:
+                waiter.callback(results)
+        if key in self.pending:
+            self._schedule_flush()
+
+    @property
+    def stats(self):
+        """
+        Returns a dictionary of queue statistics, used for debug data.
+        """
+        return {
+            "pending": len(self.pending),
+            "sent": self.sent,
+            "collapsed": self.collapsed,
+            "skipped": self.skipped,
+        }
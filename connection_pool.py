@@ -0,0 +1,58 @@
+"""
+Persistent HTTP connections to an Android IP Webcam.
+
+Each device gets its own keep-alive connection pool so status polls, setting changes and snapshots reuse an
+open connection instead of paying for a new TCP (and TLS) handshake on every request.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from twisted.internet import reactor
+from twisted.web.client import HTTPConnectionPool
+
+
+class DeviceConnectionPool(HTTPConnectionPool):
+    """
+    HTTPConnectionPool that counts how often connections are created versus reused.
+
+    :param max_size: Maximum number of idle connections kept open to the phone.
+    :param idle_timeout: Seconds an idle connection is kept before being closed.
+    """
+    def __init__(self, max_size=2, idle_timeout=60):
+        super().__init__(reactor, persistent=True)
+        self.maxPersistentPerHost = max_size
+        self.cachedConnectionTimeout = idle_timeout
+        self.created = 0
+        self.reused = 0
+
+    def configure(self, max_size, idle_timeout):
+        """
+        Update the pool size and idle timeout, applies to connections returned to the pool from now on.
+        """
+        self.maxPersistentPerHost = max_size
+        self.cachedConnectionTimeout = idle_timeout
+
+    def getConnection(self, key, endpoint):
+        if self._connections.get(key):
+            self.reused += 1
+        else:
+            self.created += 1
+        return super().getConnection(key, endpoint)
+
+    @property
+    def open(self):
+        """ Number of idle connections currently held open. """
+        return sum(len(connections) for connections in self._connections.values())
+
+    @property
+    def stats(self):
+        """
+        Returns a dictionary of pool statistics, used for debug data.
+        """
+        return {
+            "open": self.open,
+            "created": self.created,
+            "reused": self.reused,
+            "max_size": self.maxPersistentPerHost,
+            "idle_timeout": self.cachedConnectionTimeout,
+        }
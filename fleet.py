@@ -0,0 +1,145 @@
+"""
+Registry of the Android IP Webcam devices loaded on this gateway.
+
+Devices register themselves when created and unregister when unloaded. The Android_IP_WebCam module attaches
+the fleet wide services (such as the poll scheduler and image worker pool) here, so devices can reach them
+without a reference to the module instance.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from os import cpu_count
+from time import time
+
+from .bulk import HostRateLimiter, matches
+from .image_pool import ImagePool
+from .metrics import prometheus_text
+from .startup_gate import ConcurrencyGate
+from .thumbnail_cache import ThumbnailCache
+
+DEVICES = {}
+
+# Ids of the devices whose first reload has finished.
+RELOADED = set()
+
+poll_scheduler = None
+
+# Decodes and resizes frames for every camera, sized by the module's image_workers variable.
+image_pool = ImagePool()
+
+# Limits how fast bulk commands are sent to each phone.
+host_limiter = HostRateLimiter()
+
+# Resized snapshots for every camera, sized by the module's thumbnail_cache_mb variable.
+thumbnail_cache = ThumbnailCache()
+
+# Limits how many device reloads and ffmpeg launches run at the same time.
+reload_gate = ConcurrencyGate("reload", limit=cpu_count() or 4)
+launch_gate = ConcurrencyGate("ffmpeg_launch", limit=cpu_count() or 4)
+
+startup_started = None
+all_available_seconds = None
+
+
+def register(device):
+    """
+    Add a device to the fleet.
+
+    :param device: Android_IPWebCam instance.
+    """
+    global startup_started
+    if startup_started is None:
+        startup_started = time()
+    DEVICES[device.device_id] = device
+    if poll_scheduler is not None:
+        poll_scheduler.add(device)
+
+
+def unregister(device):
+    """
+    Remove a device from the fleet.
+
+    :param device: Android_IPWebCam instance.
+    """
+    DEVICES.pop(device.device_id, None)
+    RELOADED.discard(device.device_id)
+    if poll_scheduler is not None:
+        poll_scheduler.remove(device)
+    _check_all_available()
+
+
+def select(selector=None):
+    """
+    Get the devices matching a selector, see bulk.matches() for the forms it can take.
+
+    :return: List of Android_IPWebCam instances.
+    """
+    return [device for device in DEVICES.values() if matches(device, selector)]
+
+
+def activity(device):
+    """
+    Called by a device when something happened that makes fresh status more valuable, such as motion or a
+    setting change.
+
+    :param device: Android_IPWebCam instance.
+    """
+    if poll_scheduler is not None:
+        poll_scheduler.boost(device)
+
+
+def reloaded(device):
+    """
+    Called by a device when its reload finishes.
+
+    :param device: Android_IPWebCam instance.
+    """
+    RELOADED.add(device.device_id)
+    _check_all_available()
+
+
+def became_available(device):
+    """
+    Called by a device when it becomes available after being unavailable.
+
+    :param device: Android_IPWebCam instance.
+    """
+    _check_all_available()
+
+
+def _check_all_available():
+    """
+    Records how long it took from the first device registering until every device had reloaded and was
+    available.
+    """
+    global all_available_seconds
+    if all_available_seconds is not None or startup_started is None or not DEVICES:
+        return
+    if all(device_id in RELOADED and device.available is True for device_id, device in DEVICES.items()):
+        all_available_seconds = round(time() - startup_started, 3)
+
+
+def set_startup_limit(limit):
+    """
+    Set how many device reloads and ffmpeg launches can run at the same time.
+    """
+    reload_gate.set_limit(limit)
+    launch_gate.set_limit(limit)
+
+
+def prometheus_metrics():
+    """
+    Returns the request and sensor metrics for every device in the Prometheus text format.
+    """
+    return prometheus_text(DEVICES.values())
+
+
+def startup_stats():
+    """
+    Returns the startup statistics for the fleet.
+    """
+    return {
+        "all_available_seconds": all_available_seconds,
+        "reload": reload_gate.stats,
+        "ffmpeg_launch": launch_gate.stats,
+    }
@@ -0,0 +1,464 @@
+"""
+Shared MJPEG connection for a single Android IP Webcam.
+
+The phone pays for every MJPEG client it serves: each one costs another JPEG encode pass and more Wi-Fi airtime.
+The frame hub holds exactly one connection to the phone's /video stream, parses the multipart stream once, and
+fans the frames out to every consumer within the gateway (motion detection, live viewers, snapshots).
+
+Consumers get a bounded queue; when a consumer falls behind, the oldest frames are dropped so a slow consumer
+never holds up the others or grows memory without limit.
+
+Programs that can only read a URL (such as ffmpeg) can use the local relay, which re-serves the hub's frames
+on 127.0.0.1 without opening another connection to the phone.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from collections import deque
+from time import time
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.interfaces import IPushProducer
+from twisted.internet.protocol import Protocol
+from twisted.web.resource import Resource
+from twisted.web.server import Site, NOT_DONE_YET
+from zope.interface import implementer
+
+from yombo.core.log import get_logger
+
+from .mjpeg import MultipartParser
+from .streaming import stream_request
+
+logger = get_logger("modules.android_ipwebcam.frame_hub")
+
+RELAY_BOUNDARY = "yomboframehub"
+
+
+class Frame(object):
+    """
+    A single JPEG frame received from the phone. The data is a read only memoryview from the stream parser;
+    use content when bytes are required. The bytes are only created once, no matter how many consumers ask.
+    """
+    __slots__ = ("sequence", "timestamp", "content_type", "data", "_content")
+
+    def __init__(self, sequence, timestamp, content_type, data):
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.content_type = content_type
+        self.data = data
+        self._content = None
+
+    @property
+    def content(self):
+        """ The frame as bytes. """
+        if self._content is None:
+            self._content = bytes(self.data)
+        return self._content
+
+    @property
+    def age(self):
+        """ Seconds since this frame was received. """
+        return time() - self.timestamp
+
+
+class FrameConsumer(object):
+    """
+    A consumer of frames from the hub. Either provide a callback to receive every frame as it arrives, or
+    call get() to pull frames from a bounded queue. When the queue is full, the oldest frame is dropped.
+    """
+    def __init__(self, hub, name, max_queue=2, callback=None):
+        self.hub = hub
+        self.name = name
+        self.callback = callback
+        self.queue = deque(maxlen=max_queue)
+        self.frames_delivered = 0
+        self.frames_dropped = 0
+        self._waiters = deque()
+
+    def put(self, frame):
+        """
+        Called by the hub for every frame received.
+
+        :param frame: Frame instance.
+        """
+        if self.callback is not None:
+            self.frames_delivered += 1
+            self.callback(frame)
+        elif self._waiters:
+            self.frames_delivered += 1
+            self._waiters.popleft().callback(frame)
+        else:
+            if len(self.queue) == self.queue.maxlen:
+                self.frames_dropped += 1
+            self.queue.append(frame)
+
+    def get(self):
+        """
+        Get the next frame. Returns a deferred that fires with a Frame, or None if the consumer was closed.
+
+        :return: Deferred
+        """
+        if self.queue:
+            self.frames_delivered += 1
+            return succeed(self.queue.popleft())
+        d = Deferred()
+        self._waiters.append(d)
+        return d
+
+    def close(self):
+        """
+        Stop receiving frames. Any pending get() calls will receive None.
+        """
+        self.hub.remove_consumer(self.name)
+        self.queue.clear()
+        while self._waiters:
+            self._waiters.popleft().callback(None)
+
+    @property
+    def stats(self):
+        return {
+            "delivered": self.frames_delivered,
+            "dropped": self.frames_dropped,
+            "queued": len(self.queue),
+        }
+
+
+@implementer(IPushProducer)
+class MJPEGViewer(object):
+    """
+    Writes frames from the hub to a twisted web request as a multipart MJPEG stream. Honors the request's
+    flow control: while the client's socket is backed up, frames collect in the bounded consumer queue and
+    the oldest are dropped.
+    """
+    def __init__(self, hub, request, name, max_queue=2):
+        self.request = request
+        self.consumer = hub.add_consumer(name, max_queue=max_queue)
+        self._paused = False
+        self._waiting = False
+        self._done = False
+
+        request.setHeader(b"content-type", f"multipart/x-mixed-replace; boundary={RELAY_BOUNDARY}".encode())
+        request.setHeader(b"cache-control", b"no-cache")
+        request.registerProducer(self, True)
+        request.notifyFinish().addBoth(self._finished)
+        self._pump()
+
+    def _pump(self):
+        if self._paused or self._waiting or self._done:
+            return
+        self._waiting = True
+        self.consumer.get().addCallback(self._write)
+
+    def _write(self, frame):
+        self._waiting = False
+        if frame is None or self._done:
+            return
+        self.request.write(
+            f"--{RELAY_BOUNDARY}\r\n"
+            f"Content-Type: {frame.content_type}\r\n"
+            f"Content-Length: {len(frame.data)}\r\n\r\n".encode()
+        )
+        self.request.write(frame.content)
+        self.request.write(b"\r\n")
+        self._pump()
+
+    def _finished(self, *args, **kwargs):
+        self._done = True
+        self.consumer.close()
+
+    def pauseProducing(self):
+        self._paused = True
+
+    def resumeProducing(self):
+        self._paused = False
+        self._pump()
+
+    def stopProducing(self):
+        self._finished()
+
+
+class MJPEGStreamProtocol(Protocol):
+    """
+    Receives the body of the /video response and hands completed frames to the hub.
+    """
+    def __init__(self, hub, boundary):
+        self.hub = hub
+        self.parser = MultipartParser(boundary)
+
+    def dataReceived(self, data):
+        if self.hub._protocol is not self:  # A stopped stream that hasn't closed yet.
+            return
+        self.hub.bytes_received += len(data)
+        for content_type, payload in self.parser.feed(data):
+            self.hub.frame_received(content_type, payload)
+
+    def connectionLost(self, reason):
+        self.hub.stream_lost(self, reason)
+
+
+class _RelayResource(Resource):
+    """
+    Serves the hub's frames to local programs, such as ffmpeg.
+    """
+    isLeaf = True
+
+    def __init__(self, hub):
+        super().__init__()
+        self.hub = hub
+
+    def render_GET(self, request):
+        self.hub.relay_clients += 1
+        MJPEGViewer(self.hub, request, f"relay:{self.hub.relay_clients}")
+        return NOT_DONE_YET
+
+
+class FrameHub(object):
+    """
+    Holds one /video connection to the phone and fans out the frames to all consumers. The connection is
+    opened when the first consumer is added and closed after idle_timeout seconds without any consumers.
+    """
+    def __init__(self, device, reconnect_delay=2, max_reconnect_delay=60, idle_timeout=10):
+        self.device = device
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.idle_timeout = idle_timeout
+
+        self.consumers = {}
+        self.latest_frame = None
+        self.sequence = 0
+        self.streaming = False
+        self.connects = 0
+        self.bytes_received = 0
+        self.relay_clients = 0
+        self.frame_interval = None  # Moving average of seconds between frames.
+        self.frame_jitter = None  # Moving average of how far each interval is from frame_interval.
+
+        self._running = False
+        self._last_frame_time = None
+        self._connecting = None
+        self._protocol = None
+        self._current_delay = reconnect_delay
+        self._reconnect_call = None
+        self._idle_call = None
+        self._relay_port = None
+
+    def add_consumer(self, name, max_queue=2, callback=None):
+        """
+        Add a consumer, starting the stream if needed. If a consumer with the same name exists, it's replaced.
+
+        :param name: Unique name for the consumer, used for stats.
+        :param max_queue: Number of frames to hold before dropping the oldest.
+        :param callback: Optional callable, called with every frame instead of queuing.
+        :return: FrameConsumer instance.
+        """
+        if name in self.consumers:
+            self.consumers[name].close()
+        consumer = FrameConsumer(self, name, max_queue=max_queue, callback=callback)
+        self.consumers[name] = consumer
+        self.start()
+        return consumer
+
+    def remove_consumer(self, name):
+        """
+        Remove a consumer. When no consumers remain, the stream is closed after idle_timeout seconds.
+
+        :param name: Name of the consumer.
+        """
+        self.consumers.pop(name, None)
+        self._check_idle()
+
+    def serve_mjpeg(self, request, name=None):
+        """
+        Stream frames to a twisted web request as multipart MJPEG.
+
+        :param request: A twisted web request.
+        :param name: Consumer name, defaults to one based on the request.
+        :return: MJPEGViewer instance.
+        """
+        if name is None:
+            name = f"viewer:{id(request)}"
+        return MJPEGViewer(self, request, name)
+
+    @property
+    def relay_url(self):
+        """
+        URL on the loopback interface serving the hub's frames. The relay listener is opened on first use.
+        """
+        if self._relay_port is None:
+            self._relay_port = reactor.listenTCP(0, Site(_RelayResource(self)), interface="127.0.0.1")
+        return f"http://127.0.0.1:{self._relay_port.getHost().port}/video"
+
+    def start(self):
+        """
+        Start the stream if it's not already running.
+        """
+        if self._idle_call is not None and self._idle_call.active():
+            self._idle_call.cancel()
+        self._idle_call = None
+        if self._running is True:
+            return
+        self._running = True
+        self._connect()
+
+    def stop(self):
+        """
+        Close the connection to the phone.
+        """
+        self._running = False
+        if self._reconnect_call is not None and self._reconnect_call.active():
+            self._reconnect_call.cancel()
+        self._reconnect_call = None
+        if self._connecting is not None:
+            connecting, self._connecting = self._connecting, None
+            connecting.cancel()
+        if self._protocol is not None:
+            # Its connectionLost may arrive after a new connection was opened, so it's forgotten now.
+            protocol, self._protocol = self._protocol, None
+            if protocol.transport is not None:
+                protocol.transport.stopProducing()
+        self.streaming = False
+
+    def restart(self):
+        """
+        Reconnect to the phone if the stream is running, used when the camera's url or auth changed.
+        Consumers stay attached.
+        """
+        if self._running is False:
+            return
+        self.stop()
+        self._current_delay = self.reconnect_delay
+        self.start()
+
+    def close(self):
+        """
+        Stop the stream, drop all consumers and close the relay. Used when the device is unloaded.
+        """
+        for consumer in list(self.consumers.values()):
+            consumer.close()
+        self.stop()
+        if self._idle_call is not None and self._idle_call.active():
+            self._idle_call.cancel()
+        if self._relay_port is not None:
+            self._relay_port.stopListening()
+            self._relay_port = None
+
+    def _check_idle(self):
+        if self.consumers or self._running is False:
+            return
+        if self._idle_call is None or not self._idle_call.active():
+            self._idle_call = reactor.callLater(self.idle_timeout, self._idle_stop)
+
+    def _idle_stop(self):
+        self._idle_call = None
+        if not self.consumers:
+            self.stop()
+
+    def _connect(self):
+        self._reconnect_call = None
+        if self._connecting is not None or self._protocol is not None:
+            return
+        d = self._connecting = stream_request(self.device.video_url, self.device.request_auth,
+                                              self.device._timeout)
+        d.addCallbacks(self._connected, self._connect_failed, callbackArgs=(d,), errbackArgs=(d,))
+
+    def _connected(self, response, connecting):
+        if connecting is not self._connecting:  # Stopped while connecting.
+            response.deliverBody(Protocol())
+            return
+        self._connecting = None
+        if self._running is False:
+            response.deliverBody(Protocol())
+            return
+        if response.code != 200:
+            logger.warn("IP Webcam video stream returned status {code}.", code=response.code)
+            response.deliverBody(Protocol())
+            self._schedule_reconnect()
+            return
+
+        content_type = response.headers.getRawHeaders(b"content-type", [b""])[0]
+        boundary = content_type.partition(b"boundary=")[2].split(b";")[0].strip(b"\" ")
+        if not boundary:
+            logger.warn("IP Webcam video stream didn't include a multipart boundary.")
+            response.deliverBody(Protocol())
+            self._schedule_reconnect()
+            return
+
+        self.connects += 1
+        self.streaming = True
+        self.frame_interval = None
+        self.frame_jitter = None
+        self._last_frame_time = None
+        self._protocol = MJPEGStreamProtocol(self, boundary)
+        response.deliverBody(self._protocol)
+
+    def _connect_failed(self, failure, connecting):
+        if connecting is not self._connecting:
+            return
+        self._connecting = None
+        if self._running is False:
+            return
+        logger.info("Unable to connect to IP Webcam video stream: {error}", error=failure.getErrorMessage())
+        self._schedule_reconnect()
+
+    def _schedule_reconnect(self):
+        if self._running is False or self._connecting is not None or self._protocol is not None:
+            return
+        if self._reconnect_call is not None and self._reconnect_call.active():
+            return
+        self._reconnect_call = reactor.callLater(self._current_delay, self._connect)
+        self._current_delay = min(self._current_delay * 2, self.max_reconnect_delay)
+
+    def frame_received(self, content_type, data):
+        """
+        Called by the stream protocol for every frame. Stores the frame and fans it out to the consumers.
+
+        :param content_type: Content type of the frame.
+        :param data: Frame as a memoryview.
+        """
+        self.sequence += 1
+        self._current_delay = self.reconnect_delay
+        frame = Frame(self.sequence, time(), content_type, data)
+        if self._last_frame_time is not None:
+            interval = frame.timestamp - self._last_frame_time
+            if self.frame_interval is None:
+                self.frame_interval = interval
+                self.frame_jitter = 0.0
+            else:
+                self.frame_jitter = self.frame_jitter * 0.9 + abs(interval - self.frame_interval) * 0.1
+                self.frame_interval = self.frame_interval * 0.9 + interval * 0.1
+        self._last_frame_time = frame.timestamp
+        self.latest_frame = frame
+
+        for consumer in list(self.consumers.values()):
+            try:
+                consumer.put(frame)
+            except Exception as e:
+                logger.warn("Frame consumer '{name}' raised an error: {error}", name=consumer.name, error=e)
+
+    def stream_lost(self, protocol, reason):
+        """
+        Called by the stream protocol when the connection closes.
+        """
+        if protocol is not self._protocol:
+            return
+        self._protocol = None
+        self.streaming = False
+        if self._running is True:
+            logger.debug("IP Webcam video stream closed, reconnecting: {reason}", reason=reason.getErrorMessage())
+            self._schedule_reconnect()
+
+    @property
+    def stats(self):
+        """
+        Returns a dictionary of hub statistics, used for debug data.
+        """
+        return {
+            "streaming": self.streaming,
+            "connects": self.connects,
+            "frames": self.sequence,
+            "fps": None if not self.frame_interval else round(1 / self.frame_interval, 2),
+            "jitter_ms": None if self.frame_jitter is None else round(self.frame_jitter * 1000, 1),
+            "bytes_received": self.bytes_received,
+            "consumers": {name: consumer.stats for name, consumer in self.consumers.items()},
+        }
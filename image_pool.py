@@ -0,0 +1,231 @@
+"""
+Worker pool for decoding and resizing JPEG frames off the reactor thread.
+
+Pillow releases the GIL while it decodes, scales and encodes, so by default the work runs on a small pool of
+threads. If the threads can't be used, or the image_worker_mode module variable is "process", a process pool
+is used instead.
+
+The pool never queues without limit. Jobs may be given a key, such as the detector they belong to; a new job
+with the same key as one that hasn't started yet replaces it, since only the newest frame matters. When
+max_pending jobs are waiting, the oldest droppable job is dropped. Jobs someone is waiting on, such as a
+viewer's thumbnail, are submitted with droppable=False and always run. Dropped jobs errback with JobDropped.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from collections import OrderedDict
+from importlib.util import find_spec
+from io import BytesIO
+from itertools import count
+import os
+import threading
+from time import time
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+
+from yombo.core.log import get_logger
+
+logger = get_logger("modules.android_ipwebcam.image_pool")
+
+# Pillow is imported by the workers on first use, not when the module loads.
+IMAGE_POOL_AVAILABLE = find_spec("PIL") is not None
+
+
+class JobDropped(Exception):
+    """
+    Raised through a job's deferred when it was dropped for a newer job or because the pool was full.
+    """
+    pass
+
+
+def resize_jpeg(data, width=None, height=None, quality=80):
+    """
+    Downscale a JPEG to fit within width x height, keeping the aspect ratio. The decoder is asked to scale
+    while decoding (DCT scaling) first, which is much faster than decoding at full size.
+
+    :param data: JPEG bytes.
+    :param width: Most pixels wide, None to only limit the height.
+    :param height: Most pixels high, None to only limit the width.
+    :param quality: JPEG quality, 1-95.
+    :return: A tuple of (jpeg bytes, width, height).
+    """
+    from PIL import Image as PILImage
+    image = PILImage.open(BytesIO(data))
+    full_width, full_height = image.size
+    scale = min(
+        1.0 if width is None else width / full_width,
+        1.0 if height is None else height / full_height,
+        1.0,
+    )
+    size = (max(1, round(full_width * scale)), max(1, round(full_height * scale)))
+    image.draft("RGB", size)
+    if image.size != size:
+        image = image.resize(size, PILImage.BILINEAR)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    output = BytesIO()
+    image.save(output, "JPEG", quality=int(quality))
+    return output.getvalue(), size[0], size[1]
+
+
+def _run_job(function, args, kwargs):
+    """
+    Runs in the worker. Returns (worker name, seconds busy, result).
+    """
+    started = time()
+    result = function(*args, **kwargs)
+    return f"{os.getpid()}:{threading.current_thread().name}", time() - started, result
+
+
+class ImagePool(object):
+    """
+    Bounded pool of workers for CPU heavy image work.
+
+    :param workers: Number of workers, defaults to the number of CPUs.
+    :param mode: "thread" or "process".
+    :param max_pending: Most jobs waiting for a worker, defaults to four per worker.
+    """
+    def __init__(self, workers=None, mode="thread", max_pending=None):
+        self.workers = max(1, int(workers or os.cpu_count() or 2))
+        self.mode = mode
+        self.max_pending = max_pending
+        self.executor = None
+        self.active = 0
+        self.pending = OrderedDict()  # key: (deferred, function, args, kwargs, submitted, droppable)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.wait_time = None
+        self.started = None
+        self.worker_stats = {}
+        self._ids = count()
+
+    def configure(self, workers=None, mode=None, max_pending=None):
+        """
+        Change the pool size or mode. Running jobs finish on the old workers.
+        """
+        workers = max(1, int(workers or self.workers))
+        mode = mode or self.mode
+        if workers != self.workers or mode != self.mode:
+            self.shutdown()
+        self.workers = workers
+        self.mode = mode
+        if max_pending is not None:
+            self.max_pending = max_pending
+
+    def _executor(self):
+        if self.executor is None:
+            self.started = time()
+            self.worker_stats = {}
+            if self.mode == "process":
+                try:
+                    from concurrent.futures import ProcessPoolExecutor
+                    self.executor = ProcessPoolExecutor(max_workers=self.workers)
+                except (ImportError, NotImplementedError, OSError) as e:
+                    logger.warn("Unable to start image worker processes, using threads: {error}", error=e)
+                    self.mode = "thread"
+            if self.executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ipwebcam")
+        return self.executor
+
+    def shutdown(self):
+        """
+        Stop the workers and drop the waiting jobs.
+        """
+        pending, self.pending = self.pending, OrderedDict()
+        for d, function, args, kwargs, submitted, droppable in pending.values():
+            self.dropped += 1
+            d.errback(JobDropped("Image pool shut down."))
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    def submit(self, function, *args, key=None, droppable=True, **kwargs):
+        """
+        Run function(*args, **kwargs) in a worker. The function must be a module level function if the pool
+        uses processes.
+
+        :param key: Jobs with the same key replace each other while waiting, None to never replace.
+        :param droppable: If False, the job isn't dropped when the pool is full, it waits for a worker.
+        :return: Deferred that fires with the function's result, or errbacks with JobDropped.
+        """
+        d = Deferred()
+        if key is None:
+            key = ("job", next(self._ids))
+        self.submitted += 1
+        stale = self.pending.pop(key, None)
+        if stale is not None:
+            self.dropped += 1
+            stale[0].errback(JobDropped("Replaced by a newer job."))
+        max_pending = self.max_pending or self.workers * 4
+        while len(self.pending) >= max_pending:
+            oldest = next((key for key, job in self.pending.items() if job[5]), None)
+            if oldest is None:
+                break
+            self.dropped += 1
+            self.pending.pop(oldest)[0].errback(JobDropped("Image pool is full."))
+        self.pending[key] = (d, function, args, kwargs, time(), droppable)
+        self._start_pending()
+        return d
+
+    def _start_pending(self):
+        while self.pending and self.active < self.workers:
+            key, (d, function, args, kwargs, submitted, droppable) = self.pending.popitem(last=False)
+            wait = time() - submitted
+            self.wait_time = wait if self.wait_time is None else self.wait_time * 0.9 + wait * 0.1
+            if self.mode == "process":
+                # Memoryviews can't be sent to another process.
+                args = tuple(bytes(arg) if isinstance(arg, memoryview) else arg for arg in args)
+            try:
+                future = self._executor().submit(_run_job, function, args, kwargs)
+            except RuntimeError as e:  # Shutting down.
+                self.dropped += 1
+                d.errback(JobDropped(str(e)))
+                continue
+            self.active += 1
+            future.add_done_callback(lambda future, d=d: reactor.callFromThread(self._finished, future, d))
+
+    def _finished(self, future, d):
+        self.active -= 1
+        try:
+            worker, busy, result = future.result()
+        except Exception as e:
+            self.failed += 1
+            self._start_pending()
+            d.errback(e)
+            return
+        self.completed += 1
+        worker_stats = self.worker_stats.setdefault(worker, {"jobs": 0, "busy_seconds": 0.0})
+        worker_stats["jobs"] += 1
+        worker_stats["busy_seconds"] += busy
+        self._start_pending()
+        d.callback(result)
+
+    @property
+    def stats(self):
+        """
+        Returns a dictionary of pool statistics, including each worker's utilization since the pool started.
+        """
+        elapsed = None if self.started is None else max(time() - self.started, 0.001)
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "active": self.active,
+            "pending": len(self.pending),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "wait_ms": None if self.wait_time is None else round(self.wait_time * 1000, 2),
+            "worker_utilization": {
+                worker: {
+                    "jobs": values["jobs"],
+                    "busy_seconds": round(values["busy_seconds"], 3),
+                    "utilization": round(values["busy_seconds"] / elapsed, 3),
+                }
+                for worker, values in self.worker_stats.items()
+            },
+        }
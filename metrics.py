@@ -0,0 +1,281 @@
+"""
+Request metrics for each camera, and a Prometheus text export for the whole fleet.
+
+Every request to a phone is counted under its endpoint: request and error counts, errors by type, bytes
+received and a latency histogram. The histogram uses the same fixed buckets for every endpoint and is stored
+as a small array of counters, so recording a request is a few integer increments. Requests refused by the
+open circuit breaker never reach the phone, so they are only counted as rejected, not in the histogram.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from array import array
+from bisect import bisect_left
+from time import time
+
+# Upper bounds, in seconds, of the latency histogram buckets. The last bucket counts everything slower.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Paths that share an endpoint, the rest are matched by prefix in endpoint_name().
+ENDPOINTS = {
+    "/enabletorch": "torch",
+    "/disabletorch": "torch",
+    "/focus": "focus",
+    "/nofocus": "focus",
+    "/startvideo": "record",
+    "/stopvideo": "record",
+}
+
+
+def endpoint_name(path):
+    """
+    Get the endpoint a request path is counted under, such as "/settings/*" for "/settings/quality".
+    """
+    path = path.split("?", 1)[0]
+    if path in ENDPOINTS:
+        return ENDPOINTS[path]
+    if path.startswith("/settings/ptz"):
+        return "ptz"
+    if path.startswith("/settings/"):
+        return "/settings/*"
+    return path
+
+
+def response_size(results):
+    """
+    Get the bytes received for a request, from the Content-Length header or the content.
+
+    :param results: Results dictionary from the requests library.
+    """
+    try:
+        return int(results["headers"]["content-length"][0])
+    except (KeyError, IndexError, TypeError, ValueError):
+        pass
+    content = results.get("content")
+    if isinstance(content, (bytes, str)):
+        return len(content)
+    return 0
+
+
+def http_error(results):
+    """
+    Get the error type for an HTTP error status, such as "http_404".
+
+    :param results: Results dictionary from the requests library.
+    :return: None if the status is below 400 or unknown.
+    """
+    code = getattr(results.get("response"), "code", None)
+    if isinstance(code, int) and code >= 400:
+        return f"http_{code}"
+    return None
+
+
+class EndpointMetrics(object):
+    """
+    Counters and latency histogram for one endpoint.
+    """
+    __slots__ = ("requests", "rejected", "errors", "error_types", "bytes", "latency_sum", "buckets")
+
+    def __init__(self):
+        self.requests = 0
+        self.rejected = 0
+        self.errors = 0
+        self.error_types = {}
+        self.bytes = 0
+        self.latency_sum = 0.0
+        self.buckets = array("L", bytes(array("L").itemsize * (len(LATENCY_BUCKETS) + 1)))
+
+    def record(self, seconds, size=0, error=None):
+        self.requests += 1
+        self.bytes += size
+        self.latency_sum += seconds
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        if error is not None:
+            self.errors += 1
+            self.error_types[error] = self.error_types.get(error, 0) + 1
+
+    def percentile(self, fraction):
+        """
+        Estimate a latency percentile from the histogram, as the upper bound of the bucket it falls in.
+
+        :param fraction: Such as 0.99.
+        :return: Seconds, None if there are no requests. Float infinity if it's past the last bucket.
+        """
+        if self.requests == 0:
+            return None
+        target = self.requests * fraction
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else float("inf")
+        return float("inf")
+
+    @property
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "error_types": dict(self.error_types),
+            "bytes": self.bytes,
+            "mean_ms": None if self.requests == 0 else round(self.latency_sum * 1000 / self.requests, 2),
+            "p50_ms": _milliseconds(self.percentile(0.5)),
+            "p99_ms": _milliseconds(self.percentile(0.99)),
+            "histogram": dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], self.buckets)),
+        }
+
+
+def _milliseconds(seconds):
+    if seconds is None or seconds == float("inf"):
+        return seconds
+    return round(seconds * 1000, 2)
+
+
+class DeviceMetrics(object):
+    """
+    Request metrics for one camera.
+    """
+    def __init__(self):
+        self.endpoints = {}
+
+    def record(self, path, seconds, size=0, error=None):
+        """
+        Record a finished request.
+
+        :param path: Request path, such as "/status.json".
+        :param seconds: How long it took.
+        :param size: Bytes received.
+        :param error: Error type name if it failed, such as "CancelledError".
+        """
+        name = endpoint_name(path)
+        endpoint = self.endpoints.get(name)
+        if endpoint is None:
+            endpoint = self.endpoints[name] = EndpointMetrics()
+        endpoint.record(seconds, size, error)
+
+    def rejected(self, path):
+        """
+        Count a request that wasn't sent because the circuit breaker is open.
+
+        :param path: Request path, such as "/status.json".
+        """
+        name = endpoint_name(path)
+        endpoint = self.endpoints.get(name)
+        if endpoint is None:
+            endpoint = self.endpoints[name] = EndpointMetrics()
+        endpoint.rejected += 1
+
+    @property
+    def stats(self):
+        """
+        Returns the metrics for each endpoint, used for debug data.
+        """
+        return {name: endpoint.stats for name, endpoint in sorted(self.endpoints.items())}
+
+
+class RateMeter(object):
+    """
+    Moving averages of how often something happens and how long it takes, for the sensors' frame rates and
+    processing times.
+    """
+    __slots__ = ("interval", "duration", "count", "_last")
+
+    def __init__(self):
+        self.interval = None
+        self.duration = None
+        self.count = 0
+        self._last = None
+
+    def record(self, duration, now=None):
+        """
+        Record one event that took duration seconds.
+        """
+        now = time() if now is None else now
+        if self._last is not None:
+            interval = now - self._last
+            self.interval = interval if self.interval is None else self.interval * 0.9 + interval * 0.1
+        self._last = now
+        self.duration = duration if self.duration is None else self.duration * 0.9 + duration * 0.1
+        self.count += 1
+
+    @property
+    def rate(self):
+        """ Events per second, None until there have been two. """
+        return None if not self.interval else round(1 / self.interval, 2)
+
+    @property
+    def duration_ms(self):
+        """ Milliseconds each event takes. """
+        return None if self.duration is None else round(self.duration * 1000, 3)
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def prometheus_text(devices):
+    """
+    Format the metrics of a set of devices in the Prometheus text exposition format.
+
+    :param devices: Iterable of Android_IPWebCam instances.
+    :return: String.
+    """
+    lines = [
+        "# HELP ipwebcam_requests_total Requests sent to the phone.",
+        "# TYPE ipwebcam_requests_total counter",
+    ]
+    requests, rejected, errors, received, histograms, available, rates, durations = [], [], [], [], [], [], [], []
+    for device in devices:
+        camera = _label(device.machine_label)
+        available.append(f'ipwebcam_available{{camera="{camera}"}} {1 if device.available is True else 0}')
+        for name, endpoint in sorted(device.metrics.endpoints.items()):
+            labels = f'camera="{camera}",endpoint="{_label(name)}"'
+            requests.append(f"ipwebcam_requests_total{{{labels}}} {endpoint.requests}")
+            rejected.append(f"ipwebcam_requests_rejected_total{{{labels}}} {endpoint.rejected}")
+            for error, count in sorted(endpoint.error_types.items()):
+                errors.append(f'ipwebcam_request_errors_total{{{labels},type="{_label(error)}"}} {count}')
+            received.append(f"ipwebcam_received_bytes_total{{{labels}}} {endpoint.bytes}")
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), endpoint.buckets):
+                cumulative += count
+                histograms.append(f'ipwebcam_request_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            histograms.append(f"ipwebcam_request_seconds_sum{{{labels}}} {endpoint.latency_sum:.6f}")
+            histograms.append(f"ipwebcam_request_seconds_count{{{labels}}} {endpoint.requests}")
+        for sensor, meter in device.sensor_meters.items():
+            labels = f'camera="{camera}",sensor="{sensor}"'
+            if meter.rate is not None:
+                rates.append(f"ipwebcam_sensor_rate{{{labels}}} {meter.rate}")
+            if meter.duration is not None:
+                durations.append(f"ipwebcam_sensor_process_seconds{{{labels}}} {meter.duration:.6f}")
+
+    lines += requests
+    lines += [
+        "# HELP ipwebcam_requests_rejected_total Requests not sent because the camera is unreachable.",
+        "# TYPE ipwebcam_requests_rejected_total counter",
+    ] + rejected
+    lines += [
+        "# HELP ipwebcam_request_errors_total Failed requests by error type.",
+        "# TYPE ipwebcam_request_errors_total counter",
+    ] + errors
+    lines += [
+        "# HELP ipwebcam_received_bytes_total Bytes received from the phone.",
+        "# TYPE ipwebcam_received_bytes_total counter",
+    ] + received
+    lines += [
+        "# HELP ipwebcam_request_seconds Request latency.",
+        "# TYPE ipwebcam_request_seconds histogram",
+    ] + histograms
+    lines += [
+        "# HELP ipwebcam_available 1 if the camera is available.",
+        "# TYPE ipwebcam_available gauge",
+    ] + available
+    lines += [
+        "# HELP ipwebcam_sensor_rate Frames or audio chunks analyzed per second.",
+        "# TYPE ipwebcam_sensor_rate gauge",
+    ] + rates
+    lines += [
+        "# HELP ipwebcam_sensor_process_seconds Time to analyze one frame or audio chunk.",
+        "# TYPE ipwebcam_sensor_process_seconds gauge",
+    ] + durations
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,182 @@
+"""
+Streaming parser for multipart/x-mixed-replace (MJPEG) streams.
+
+Frames are returned as memoryviews. When a frame's Content-Length is known and the whole frame arrived in one
+read, the view points straight into the received bytes and nothing is copied. Otherwise the frame is assembled
+into a bytearray allocated once at its final size. Frames without a Content-Length are found by searching for
+the boundary, only scanning the newly received bytes.
+
+This module has no dependencies so it can be benchmarked on its own, see benchmarks/mjpeg_parser.py.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+MAX_HEADER_SIZE = 4096
+
+_HEADERS = 0
+_BODY = 1
+
+
+class MultipartParser(object):
+    """
+    Splits a multipart stream into (content_type, memoryview) frames.
+
+    :param boundary: The boundary from the Content-Type header, with or without the leading dashes.
+    """
+    def __init__(self, boundary):
+        if isinstance(boundary, str):
+            boundary = boundary.encode()
+        if not boundary.startswith(b"--"):
+            boundary = b"--" + boundary
+        self.delimiter = boundary
+        self.frames = 0
+        self.bytes = 0
+        self._state = _HEADERS
+        self._pending = bytearray()  # Partial part headers carried over between reads.
+        self._content_type = None
+        self._length = -1
+        self._frame = None
+        self._frame_view = None
+        self._filled = 0
+        self._body = bytearray()  # Frame being assembled when there's no Content-Length.
+
+    def feed(self, data):
+        """
+        Parse the next bytes of the stream.
+
+        :param data: Bytes received from the stream.
+        :return: List of (content_type, memoryview) tuples for each completed frame.
+        """
+        frames = []
+        view = memoryview(data)
+        position = 0
+        size = len(data)
+        self.bytes += size
+        while position < size:
+            if self._state == _HEADERS:
+                position = self._read_headers(data, position)
+            elif self._length >= 0:
+                position = self._read_sized(view, position, frames)
+            else:
+                position = self._read_unsized(data, view, position, frames)
+        self.frames += len(frames)
+        return frames
+
+    def _read_headers(self, data, position):
+        """
+        Find the boundary and the end of the part headers. Returns the position in data to continue from.
+        """
+        delimiter = self.delimiter
+        if self._pending:
+            chunk = data[position:position + MAX_HEADER_SIZE]
+            window = self._pending + chunk
+            # Position in window of data[position].
+            shift = len(self._pending)
+            consumed = position + len(chunk)
+            start = window.find(delimiter)
+        else:
+            window = data
+            shift = position
+            consumed = len(data)
+            start = window.find(delimiter, position)
+
+        if start == -1:
+            keep = len(delimiter) - 1
+            self._pending = bytearray(window[-keep:]) if keep else bytearray()
+            return consumed
+        end = window.find(b"\r\n\r\n", start)
+        if end == -1:
+            if len(window) - start > MAX_HEADER_SIZE:  # Not a real boundary, skip past it.
+                self._pending = bytearray()
+                return position + max(start + len(delimiter) - shift, 0)
+            self._pending = bytearray(window[start:])
+            return consumed
+
+        self._content_type, self._length = parse_part_headers(bytes(window[start + len(delimiter):end]))
+        self._pending = bytearray()
+        self._state = _BODY
+        return position + end + 4 - shift
+
+    def _read_sized(self, view, position, frames):
+        """
+        Read a frame with a known Content-Length.
+        """
+        length = self._length
+        available = len(view) - position
+        if self._frame is None:
+            if available >= length:  # Fast path, the whole frame is in this read.
+                frames.append((self._content_type, view[position:position + length]))
+                self._state = _HEADERS
+                return position + length
+            self._frame = bytearray(length)
+            self._frame_view = memoryview(self._frame)
+            self._filled = 0
+
+        count = min(length - self._filled, available)
+        self._frame_view[self._filled:self._filled + count] = view[position:position + count]
+        self._filled += count
+        if self._filled == length:
+            frames.append((self._content_type, self._frame_view))
+            self._frame = None
+            self._frame_view = None
+            self._state = _HEADERS
+        return position + count
+
+    def _read_unsized(self, data, view, position, frames):
+        """
+        Read a frame without a Content-Length by searching for the next boundary.
+        """
+        delimiter = self.delimiter
+        if not self._body:
+            end = data.find(delimiter, position)
+            if end != -1:  # Fast path, the whole frame is in this read.
+                frames.append((self._content_type, view[position:_strip_newline(data, position, end)]))
+                self._state = _HEADERS
+                return end
+
+        previous = len(self._body)
+        self._body += view[position:]
+        end = self._body.find(delimiter, max(0, previous - len(delimiter) + 1))
+        if end == -1:
+            return len(data)
+
+        body = self._body
+        self._body = bytearray()  # The frame's view keeps the old buffer alive.
+        frames.append((self._content_type, memoryview(body)[:_strip_newline(body, 0, end)]))
+        self._state = _HEADERS
+        if end < previous:
+            # The boundary started in an earlier read, carry those bytes over to the header search.
+            self._pending = bytearray(body[end:previous])
+            return position
+        return position + end - previous
+
+
+def _strip_newline(buffer, start, end):
+    """
+    Returns end, less the CRLF that comes before the boundary if present.
+    """
+    if end - start >= 2 and buffer[end - 2:end] == b"\r\n":
+        return end - 2
+    return end
+
+
+def parse_part_headers(raw_headers):
+    """
+    Get the content type and content length from a part's headers.
+
+    :param raw_headers: Bytes between the boundary and the blank line.
+    :return: A tuple of (content_type, content_length), content_length is -1 if not sent.
+    """
+    content_type = "image/jpeg"
+    length = -1
+    for line in raw_headers.split(b"\r\n"):
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-type":
+            content_type = value.strip().decode(errors="replace")
+        elif name == b"content-length":
+            try:
+                length = int(value.strip())
+            except ValueError:
+                length = -1
+    return content_type, length
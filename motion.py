@@ -0,0 +1,236 @@
+"""
+In-process motion detection using frames from the frame hub.
+
+Replaces the ffmpeg motion sensor: instead of a separate decoder process with its own connection to the phone,
+frames already received by the frame hub are decoded at a reduced JPEG DCT scale into small grayscale images and
+compared with NumPy.
+
+Settings match the ffmpeg sensor:
+
+* sensitivity - Percent of pixels that must change for a frame to count as motion.
+* denoise - How much a pixel's brightness (0-255) must change before it counts as changed.
+* reactivate_timeout - Seconds after motion ends before it can trip again.
+* low_timeout - Seconds without motion before motion ends.
+* framerate - Most frames per second to analyze. Fewer are analyzed if the gateway is busy.
+
+Frames are decoded on the image worker pool, see image_pool.py, so the reactor thread only compares the small
+decoded images.
+
+Only the pixel blocks inside the configured zones, less any exclusions, are compared; see zones.py. With
+zones, sensitivity is the percent of a zone's pixels that must change.
+
+Requires NumPy and Pillow, check MOTION_AVAILABLE before using.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from io import BytesIO
+from time import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    from PIL import Image as PILImage
+except ImportError:
+    PILImage = None
+
+from twisted.internet.defer import succeed
+
+from yombo.core.log import get_logger
+
+from .image_pool import JobDropped
+from .metrics import RateMeter
+from .trip_state import TripState
+from .zones import ZoneMask
+
+logger = get_logger("modules.android_ipwebcam.motion")
+
+MOTION_AVAILABLE = numpy is not None and PILImage is not None
+
+
+def decode_grayscale(data, width):
+    """
+    Decode a JPEG into a grayscale NumPy array about width pixels wide. The JPEG decoder is asked to scale
+    while decoding (DCT scaling), which is much faster than decoding at full size and then resizing.
+
+    :param data: JPEG bytes.
+    :param width: Target width in pixels.
+    :return: 2d uint8 NumPy array.
+    """
+    image = PILImage.open(BytesIO(data))
+    full_width, full_height = image.size
+    height = max(1, round(width * full_height / full_width))
+    image.draft("L", (width, height))
+    image = image.convert("L")
+    if image.size != (width, height):
+        image = image.resize((width, height), PILImage.NEAREST)
+    return numpy.asarray(image)
+
+
+class MotionDetector(object):
+    """
+    Detects motion in the frames from a FrameHub. Has the same open_sensor()/close() interface as the ffmpeg
+    SensorMotion so the device can use either one.
+
+    :param frame_hub: The device's FrameHub.
+    :param image_pool: ImagePool used to decode the frames.
+    :param callback: Called with (state, duration, trip_count), and zone when zones are set.
+    :param zones: Parsed zone polygons from zones.parse_polygons(), None or empty for the whole frame.
+    :param exclusions: Parsed exclusion polygons.
+    :param width: Width in pixels of the images compared.
+    :param max_load: Fraction of wall time the detector may spend analyzing frames before skipping more.
+    """
+    def __init__(self, frame_hub, image_pool, callback, sensitivity=15, denoise=10, reactivate_timeout=10,
+                 low_timeout=10, framerate=8, zones=None, exclusions=None, width=160, max_load=0.5,
+                 connected_callback=None, closed_callback=None):
+        self.frame_hub = frame_hub
+        self.image_pool = image_pool
+        self.sensitivity = float(sensitivity)
+        self.denoise = float(denoise)
+        self.framerate = float(framerate)
+        self.width = width
+        self.max_load = max_load
+        self.connected_callback = connected_callback
+        self.closed_callback = closed_callback
+        self.trip_state = TripState(callback, reactivate_timeout=float(reactivate_timeout),
+                                    low_timeout=float(low_timeout))
+
+        self.zones = zones or []
+        self.exclusions = exclusions or []
+        self.mask = None
+        self.consumer = None
+        self.frames_analyzed = 0
+        self.frames_skipped = 0
+        self.frames_dropped = 0
+        self.meter = RateMeter()
+        self.process_time = None
+        self._previous = None
+        self._difference = None
+        self._next_frame_time = 0
+        self._last_frame_time = 0
+
+    def reconfigure(self, sensitivity, denoise, reactivate_timeout, low_timeout, framerate, zones=None,
+                    exclusions=None):
+        """
+        Apply new settings without interrupting the frames.
+        """
+        self.sensitivity = float(sensitivity)
+        self.denoise = float(denoise)
+        self.framerate = float(framerate)
+        self.trip_state.reconfigure(float(reactivate_timeout), float(low_timeout))
+        zones = zones or []
+        exclusions = exclusions or []
+        if zones != self.zones or exclusions != self.exclusions:
+            self.zones = zones
+            self.exclusions = exclusions
+            self.mask = None
+
+    def open_sensor(self, *args, **kwargs):
+        """
+        Start receiving frames from the frame hub. Arguments are accepted for compatibility with the ffmpeg
+        sensor and ignored; the frame hub already knows the video url.
+        """
+        if self.consumer is None:
+            self.consumer = self.frame_hub.add_consumer("motion", max_queue=1, callback=self.frame_received)
+            if self.connected_callback is not None:
+                self.connected_callback()
+        return succeed(True)
+
+    def close(self):
+        """
+        Stop receiving frames.
+        """
+        if self.consumer is None:
+            return
+        self.consumer.close()
+        self.consumer = None
+        self._previous = None
+        self._last_frame_time = 0
+        self.trip_state.reset()
+        if self.closed_callback is not None:
+            self.closed_callback()
+
+    def frame_received(self, frame):
+        """
+        Called by the frame hub with each frame. Frames arriving faster than the frame rate, or while the
+        detector is over its load budget, are skipped. The frame is decoded on the image pool; if the pool
+        is behind, a newer frame replaces this one before it's decoded.
+
+        :param frame: Frame instance.
+        """
+        now = time()
+        if now < self._next_frame_time:
+            self.frames_skipped += 1
+            return
+        self._next_frame_time = now + 1 / self.framerate
+
+        d = self.image_pool.submit(decode_grayscale, frame.data, self.width, key=("motion", id(self)))
+        d.addCallback(self._decoded, frame.timestamp, now)
+        d.addErrback(self._decode_failed)
+
+    def _decoded(self, image, timestamp, started):
+        if self.consumer is None or timestamp <= self._last_frame_time:
+            self.frames_dropped += 1  # Closed, or a newer frame finished first.
+            return
+        self._last_frame_time = timestamp
+        self.analyze(image)
+        elapsed = time() - started
+        self.meter.record(elapsed)
+
+        if self.process_time is None:
+            self.process_time = elapsed
+        else:
+            self.process_time = self.process_time * 0.8 + elapsed * 0.2
+        interval = 1 / self.framerate
+        if self.process_time > interval * self.max_load:
+            interval = self.process_time / self.max_load
+        self._next_frame_time = started + interval
+
+    def _decode_failed(self, failure):
+        if failure.check(JobDropped):
+            self.frames_dropped += 1
+        else:
+            logger.debug("Unable to analyze frame for motion: {error}", error=failure.getErrorMessage())
+
+    def analyze(self, image):
+        """
+        Compare the active blocks of an image to the previous one and trip if enough pixels changed in
+        any zone.
+
+        :param image: 2d uint8 NumPy array.
+        """
+        self.frames_analyzed += 1
+        if self.mask is None or self.mask.shape != image.shape:
+            self.mask = ZoneMask(image.shape, self.zones, self.exclusions)
+            self._previous = None
+
+        current = self.mask.gather(image).astype(numpy.int16)
+        previous = self._previous
+        self._previous = current
+        if previous is None:
+            self._difference = numpy.empty(current.shape, dtype=numpy.int16)
+            return
+
+        numpy.subtract(current, previous, out=self._difference)
+        numpy.abs(self._difference, out=self._difference)
+        changed = numpy.count_nonzero(self._difference > self.denoise, axis=1)
+        tripped, zone = self.mask.changed_zone(changed, self.sensitivity)
+        if tripped:
+            self.trip_state.trigger(zone=zone)
+
+    @property
+    def stats(self):
+        """
+        Returns a dictionary of detector statistics, used for debug data.
+        """
+        return {
+            "engine": "native",
+            "frames_analyzed": self.frames_analyzed,
+            "frames_skipped": self.frames_skipped,
+            "frames_dropped": self.frames_dropped,
+            "active_blocks": None if self.mask is None else len(self.mask.index),
+            "process_ms": None if self.process_time is None else round(self.process_time * 1000, 2),
+            "analyzed_fps": self.meter.rate,
+        }
@@ -0,0 +1,257 @@
+"""
+In-process noise detection reading the phone's /audio.wav stream.
+
+Replaces the ffmpeg noise sensor. The PCM samples are read straight from the WAV stream into a reusable buffer
+of fixed size chunks (100ms of audio), and the level of each chunk is computed with NumPy. When the level is
+at or above the sensitivity (in dBFS, -25 by default), the sensor trips.
+
+Requires NumPy, check NOISE_AVAILABLE before using.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from math import log10
+from struct import unpack_from
+from time import perf_counter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from twisted.internet import reactor
+from twisted.internet.defer import succeed
+from twisted.internet.protocol import Protocol
+
+from yombo.core.log import get_logger
+
+from .metrics import RateMeter
+from .streaming import stream_request
+from .trip_state import TripState
+
+logger = get_logger("modules.android_ipwebcam.noise")
+
+NOISE_AVAILABLE = numpy is not None
+
+
+class WavStreamProtocol(Protocol):
+    """
+    Parses the WAV header, then copies the 16 bit PCM samples into the detector's chunk buffer.
+    """
+    def __init__(self, detector):
+        self.detector = detector
+        self._header = bytearray()
+        self._in_data = False
+
+    def dataReceived(self, data):
+        if self._in_data is False:
+            self._header.extend(data)
+            data = self._parse_header()
+            if data is None:
+                return
+        self.detector.pcm_received(data)
+
+    def _parse_header(self):
+        """
+        Find the format and data chunks. Returns the bytes after the data chunk header, or None if more header
+        bytes are needed.
+        """
+        header = self._header
+        if len(header) < 12:
+            return None
+        if header[0:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise ValueError("Audio stream is not a WAV stream.")
+        offset = 12
+        while offset + 8 <= len(header):
+            chunk_id = bytes(header[offset:offset + 4])
+            chunk_size = unpack_from("<I", header, offset + 4)[0]
+            if chunk_id == b"data":
+                self._in_data = True
+                remaining = bytes(header[offset + 8:])
+                self._header = None
+                return remaining
+            if offset + 8 + chunk_size > len(header):
+                return None
+            if chunk_id == b"fmt ":
+                channels, sample_rate = unpack_from("<HI", header, offset + 10)
+                bits = unpack_from("<H", header, offset + 22)[0]
+                if bits != 16:
+                    raise ValueError(f"Only 16 bit audio is supported, got {bits} bits.")
+                self.detector.set_format(channels, sample_rate)
+            offset += 8 + chunk_size + (chunk_size & 1)
+        return None
+
+    def connectionLost(self, reason):
+        self.detector.stream_lost(self, reason)
+
+
+class NoiseDetector(object):
+    """
+    Detects noise on the phone's audio stream. Has the same open_sensor()/close() interface as the ffmpeg
+    SensorNoise so the device can use either one.
+
+    :param device: The Android_IPWebCam device, used for the request auth and timeout.
+    :param callback: Called with (state, duration, trip_count).
+    :param sensitivity: Level in dBFS at or above which the sensor trips.
+    :param reactivate_timeout: Seconds after noise ends before it can trip again.
+    :param low_timeout: Seconds without noise before noise ends.
+    :param chunk_seconds: Length of audio measured at once.
+    """
+    def __init__(self, device, callback, sensitivity=-25, reactivate_timeout=30, low_timeout=30,
+                 chunk_seconds=0.1, connected_callback=None, closed_callback=None):
+        self.device = device
+        self.sensitivity = float(sensitivity)
+        self.chunk_seconds = chunk_seconds
+        self.connected_callback = connected_callback
+        self.closed_callback = closed_callback
+        self.trip_state = TripState(callback, reactivate_timeout=float(reactivate_timeout),
+                                    low_timeout=float(low_timeout))
+
+        self.url = None
+        self.level = None
+        self.chunks_measured = 0
+        self.meter = RateMeter()
+        self._running = False
+        self._connecting = None
+        self._protocol = None
+        self._reconnect_call = None
+        self._reconnect_delay = 2
+        self._buffer = None
+        self._samples = None
+        self._scratch = None
+        self._filled = 0
+
+    def reconfigure(self, sensitivity, reactivate_timeout, low_timeout):
+        """
+        Apply new settings without reconnecting to the audio stream.
+        """
+        self.sensitivity = float(sensitivity)
+        self.trip_state.reconfigure(float(reactivate_timeout), float(low_timeout))
+
+    def open_sensor(self, url):
+        """
+        Connect to the audio stream.
+
+        :param url: URL of the phone's audio.wav stream.
+        """
+        self.url = url
+        self._running = True
+        if self._protocol is None and self._connecting is None:
+            self._connect()
+        return succeed(True)
+
+    def close(self):
+        """
+        Disconnect from the audio stream.
+        """
+        was_running = self._running
+        self._running = False
+        if self._reconnect_call is not None and self._reconnect_call.active():
+            self._reconnect_call.cancel()
+        self._reconnect_call = None
+        if self._connecting is not None:
+            self._connecting.cancel()
+        if self._protocol is not None and self._protocol.transport is not None:
+            self._protocol.transport.stopProducing()
+        self._protocol = None
+        self.trip_state.reset()
+        if was_running and self.closed_callback is not None:
+            self.closed_callback()
+
+    def set_format(self, channels, sample_rate):
+        """
+        Called once the WAV header is parsed, allocates the chunk buffer.
+        """
+        samples = max(1, int(sample_rate * channels * self.chunk_seconds))
+        self._buffer = bytearray(samples * 2)
+        self._samples = numpy.frombuffer(self._buffer, dtype="<i2")
+        self._scratch = numpy.empty(samples, dtype=numpy.float64)
+        self._filled = 0
+
+    def pcm_received(self, data):
+        """
+        Copy PCM bytes into the chunk buffer, measuring each chunk as it fills.
+        """
+        if self._buffer is None:
+            return
+        view = memoryview(data)
+        size = len(self._buffer)
+        while view:
+            count = min(size - self._filled, len(view))
+            self._buffer[self._filled:self._filled + count] = view[:count]
+            self._filled += count
+            view = view[count:]
+            if self._filled == size:
+                self._filled = 0
+                self.measure()
+
+    def measure(self):
+        """
+        Compute the level of the full chunk buffer in dBFS, and trip if it's loud enough.
+        """
+        started = perf_counter()
+        numpy.copyto(self._scratch, self._samples)
+        mean_square = numpy.dot(self._scratch, self._scratch) / self._scratch.size
+        if mean_square > 0:
+            self.level = 10 * log10(mean_square / (32768.0 * 32768.0))
+        else:
+            self.level = -96.0
+        self.chunks_measured += 1
+        if self.level >= self.sensitivity:
+            self.trip_state.trigger()
+        self.meter.record(perf_counter() - started)
+
+    def _connect(self):
+        self._reconnect_call = None
+        self._connecting = stream_request(self.url, self.device.request_auth, self.device._timeout)
+        self._connecting.addCallbacks(self._connected, self._connect_failed)
+
+    def _connected(self, response):
+        self._connecting = None
+        if self._running is False or response.code != 200:
+            response.deliverBody(Protocol())
+            if self._running is True:
+                logger.warn("IP Webcam audio stream returned status {code}.", code=response.code)
+                self._schedule_reconnect()
+            return
+        self._reconnect_delay = 2
+        self._buffer = None
+        self._protocol = WavStreamProtocol(self)
+        response.deliverBody(self._protocol)
+        if self.connected_callback is not None:
+            self.connected_callback()
+
+    def _connect_failed(self, failure):
+        self._connecting = None
+        if self._running is True:
+            logger.info("Unable to connect to IP Webcam audio stream: {error}", error=failure.getErrorMessage())
+            self._schedule_reconnect()
+
+    def _schedule_reconnect(self):
+        self._reconnect_call = reactor.callLater(self._reconnect_delay, self._connect)
+        self._reconnect_delay = min(self._reconnect_delay * 2, 60)
+
+    def stream_lost(self, protocol, reason):
+        """
+        Called by the WAV protocol when the stream closes.
+        """
+        if protocol is not self._protocol:
+            return
+        self._protocol = None
+        if self._running is True:
+            logger.debug("IP Webcam audio stream closed, reconnecting: {reason}", reason=reason.getErrorMessage())
+            self._schedule_reconnect()
+
+    @property
+    def stats(self):
+        """
+        Returns a dictionary of detector statistics, used for debug data.
+        """
+        return {
+            "engine": "native",
+            "connected": self._protocol is not None,
+            "level_dbfs": None if self.level is None else round(self.level, 1),
+            "chunks_measured": self.chunks_measured,
+            "chunks_per_second": self.meter.rate,
+            "process_ms": self.meter.duration_ms,
+        }
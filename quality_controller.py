@@ -0,0 +1,245 @@
+"""
+Automatic video quality and resolution control.
+
+Watches the frame rate and frame jitter measured by the frame hub, and how long status requests take. When the
+phone or its Wi-Fi link can't keep up, the JPEG quality is stepped down, then the video size. When there's
+headroom again, the video size is stepped back up, then the quality, never past the settings the camera had
+when the controller started.
+
+Changes are rate limited: a change needs several checks in a row agreeing, changes are at least change_interval
+seconds apart, and quality isn't raised until upgrade_delay seconds after it was lowered. If raising it causes
+a drop again soon after, upgrade_delay doubles, so the controller settles instead of flapping.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from time import time
+
+from twisted.internet import reactor
+
+from yombo.core.log import get_logger
+
+logger = get_logger("modules.android_ipwebcam.quality_controller")
+
+OVERLOADED = "overloaded"
+HEADROOM = "headroom"
+STEADY = "steady"
+
+
+def video_size_pixels(value):
+    """
+    Get the number of pixels for a video_size value such as "1280x720", 0 if it can't be parsed.
+    """
+    try:
+        width, height = str(value).lower().split("x")
+        return int(width) * int(height)
+    except ValueError:
+        return 0
+
+
+class QualityController(object):
+    """
+    Closed loop controller for a camera's quality and video_size settings.
+
+    :param device: Android_IPWebCam instance.
+    :param min_fps: Frame rate below which the camera is overloaded.
+    :param min_quality: Lowest JPEG quality to step down to.
+    :param max_latency: Seconds a status request may take before the camera is overloaded.
+    :param max_jitter: Frame jitter, as a fraction of the frame interval, before the camera is overloaded.
+    :param quality_step: How much to change the quality each step.
+    :param check_interval: Seconds between checks.
+    :param samples: Checks in a row that must agree before changing anything.
+    :param change_interval: Least seconds between changes.
+    :param upgrade_delay: Seconds after stepping down before stepping up again.
+    :param max_upgrade_delay: Longest upgrade_delay after repeated flapping.
+    """
+    def __init__(self, device, min_fps=10, min_quality=30, max_latency=1.0, max_jitter=0.5, quality_step=10,
+                 check_interval=5, samples=3, change_interval=30, upgrade_delay=120, max_upgrade_delay=1800):
+        self.device = device
+        self.min_fps = float(min_fps)
+        self.min_quality = float(min_quality)
+        self.max_latency = float(max_latency)
+        self.max_jitter = float(max_jitter)
+        self.quality_step = quality_step
+        self.check_interval = check_interval
+        self.samples = samples
+        self.change_interval = change_interval
+        self.base_upgrade_delay = upgrade_delay
+        self.upgrade_delay = upgrade_delay
+        self.max_upgrade_delay = max_upgrade_delay
+
+        self.ceiling = None  # (quality, video_size) when the controller started.
+        self.state = STEADY
+        self.state_count = 0
+        self.last_change = 0
+        self.last_downgrade = 0
+        self.last_upgrade = 0
+        self.last_reason = None
+        self.downgrades = 0
+        self.upgrades = 0
+        self._call = None
+
+    def reconfigure(self, min_fps, min_quality, max_latency):
+        """
+        Apply new limits from the device variables.
+        """
+        self.min_fps = float(min_fps)
+        self.min_quality = float(min_quality)
+        self.max_latency = float(max_latency)
+
+    def start(self):
+        """
+        Start checking the camera.
+        """
+        if self._call is None:
+            self._call = reactor.callLater(self.check_interval, self._check)
+
+    def stop(self):
+        """
+        Stop checking. The settings are left as they are.
+        """
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+
+    def _check(self):
+        self._call = reactor.callLater(self.check_interval, self._check)
+        try:
+            self.check()
+        except Exception as e:
+            logger.warn("Quality controller check failed: {error}", error=e)
+
+    def measurements(self):
+        """
+        Returns a tuple of (fps, jitter as a fraction of the frame interval, status latency). Values that
+        aren't known, such as the frame rate while not streaming, are None.
+        """
+        hub = self.device._frame_hub  # Not the frame_hub property, which would create one.
+        fps = jitter = None
+        if hub is not None and hub.streaming and hub.frame_interval:
+            fps = 1 / hub.frame_interval
+            jitter = hub.frame_jitter / hub.frame_interval
+        return fps, jitter, self.device.update_timings.get("status")
+
+    def classify(self, fps, jitter, latency):
+        """
+        Decide if the camera is overloaded, has headroom, or is steady.
+
+        :return: A tuple of (state, reason).
+        """
+        if fps is not None and fps < self.min_fps:
+            return OVERLOADED, f"{fps:.1f} fps"
+        if jitter is not None and jitter > self.max_jitter:
+            return OVERLOADED, f"jitter {jitter:.0%} of frame interval"
+        if latency is not None and latency > self.max_latency:
+            return OVERLOADED, f"status took {latency:.2f}s"
+        if (fps is None or fps >= self.min_fps * 1.5) and \
+                (jitter is None or jitter < self.max_jitter / 2) and \
+                (latency is None or latency < self.max_latency / 2):
+            return HEADROOM, None
+        return STEADY, None
+
+    def check(self):
+        """
+        Measure the camera and step its settings down or up if needed.
+        """
+        settings = self.device.settings
+        if self.device.available is not True or "quality" not in settings:
+            return
+        if self.ceiling is None:
+            self.ceiling = (settings.get("quality"), settings.get("video_size"))
+
+        state, reason = self.classify(*self.measurements())
+        if state == self.state:
+            self.state_count += 1
+        else:
+            self.state = state
+            self.state_count = 1
+        now = time()
+        if self.state_count < self.samples or now - self.last_change < self.change_interval:
+            return
+
+        if state == OVERLOADED:
+            change = self.step_down()
+            if change is None:
+                return
+            if now - self.last_upgrade < self.upgrade_delay:  # Stepping up caused this, wait longer next time.
+                self.upgrade_delay = min(self.upgrade_delay * 2, self.max_upgrade_delay)
+            self.last_downgrade = now
+            self.downgrades += 1
+        elif state == HEADROOM and now - self.last_downgrade >= self.upgrade_delay:
+            change = self.step_up()
+            if change is None:
+                if self.last_downgrade and now - self.last_downgrade > self.max_upgrade_delay:
+                    self.upgrade_delay = self.base_upgrade_delay  # Stable at the ceiling, forget the flapping.
+                return
+            self.last_upgrade = now
+            self.upgrades += 1
+            reason = "headroom"
+        else:
+            return
+
+        key, value = change
+        logger.info("Changing IP Webcam {key} to {value}: {reason}", key=key, value=value, reason=reason)
+        self.last_change = now
+        self.last_reason = reason
+        self.state_count = 0
+        self.device.change_setting(key, value).addErrback(self._change_failed, key)
+
+    def _change_failed(self, failure, key):
+        logger.warn("Unable to change IP Webcam {key}: {error}", key=key, error=failure.getErrorMessage())
+
+    def _video_sizes(self):
+        """
+        Returns the available video sizes, smallest first.
+        """
+        sizes = [size for size in self.device.settings.available.get("video_size", ()) if video_size_pixels(size)]
+        return sorted(sizes, key=video_size_pixels)
+
+    def step_down(self):
+        """
+        Returns the (setting, value) that lowers the load, or None if already at the lowest.
+        """
+        quality = self.device.settings.get("quality")
+        if isinstance(quality, float) and quality > self.min_quality:
+            return "quality", int(max(self.min_quality, quality - self.quality_step))
+        current = video_size_pixels(self.device.settings.get("video_size"))
+        smaller = [size for size in self._video_sizes() if video_size_pixels(size) < current]
+        if smaller:
+            return "video_size", smaller[-1]
+        return None
+
+    def step_up(self):
+        """
+        Returns the (setting, value) that raises the quality toward the ceiling, or None if already there.
+        """
+        ceiling_quality, ceiling_size = self.ceiling
+        current = video_size_pixels(self.device.settings.get("video_size"))
+        larger = [size for size in self._video_sizes()
+                  if current < video_size_pixels(size) <= video_size_pixels(ceiling_size)]
+        if larger:
+            return "video_size", larger[0]
+        quality = self.device.settings.get("quality")
+        if isinstance(quality, float) and isinstance(ceiling_quality, float) and quality < ceiling_quality:
+            return "quality", int(min(ceiling_quality, quality + self.quality_step))
+        return None
+
+    @property
+    def stats(self):
+        """
+        Returns a dictionary of controller state, used for debug data.
+        """
+        fps, jitter, latency = self.measurements()
+        return {
+            "state": self.state,
+            "fps": None if fps is None else round(fps, 2),
+            "jitter": None if jitter is None else round(jitter, 3),
+            "status_latency": latency,
+            "quality": self.device.settings.get("quality"),
+            "video_size": self.device.settings.get("video_size"),
+            "ceiling": self.ceiling,
+            "downgrades": self.downgrades,
+            "upgrades": self.upgrades,
+            "upgrade_delay": self.upgrade_delay,
+            "last_reason": self.last_reason,
+        }
@@ -0,0 +1,290 @@
+"""
+Gateway side event clips.
+
+The recorder keeps the last few seconds of frames from the frame hub in a fixed size arena, one preallocated
+bytearray per camera, so memory use is capped no matter the frame size or rate. When motion starts, the buffered
+frames are written to an MJPEG AVI file, followed by the live frames until motion ends. Frames are written to
+disk as they arrive instead of being held in memory.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from collections import deque
+import os
+from struct import pack, unpack_from
+from time import localtime, strftime
+
+from yombo.core.log import get_logger
+
+logger = get_logger("modules.android_ipwebcam.recorder")
+
+
+def jpeg_size(data):
+    """
+    Get the (width, height) of a JPEG from its start of frame marker, without decoding it.
+
+    :param data: JPEG bytes, or a memoryview of them.
+    :return: (width, height), or (0, 0) if not found.
+    """
+    offset = 2
+    length = len(data)
+    while offset + 9 < length:
+        if data[offset] != 0xFF:
+            offset += 1
+            continue
+        marker = data[offset + 1]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = unpack_from(">HH", data, offset + 5)
+            return width, height
+        if marker == 0xD8 or marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        offset += 2 + unpack_from(">H", data, offset + 2)[0]
+    return 0, 0
+
+
+class FrameArena(object):
+    """
+    Ring buffer of JPEG frames stored back to back in one preallocated bytearray. Frames are returned as
+    memoryviews into the arena, the oldest frames are overwritten as new ones arrive.
+
+    :param capacity: Size of the arena in bytes.
+    :param max_age: Seconds of frames to keep.
+    """
+    def __init__(self, capacity, max_age):
+        self.capacity = capacity
+        self.max_age = max_age
+        self.arena = bytearray(capacity)
+        self.view = memoryview(self.arena)
+        self.frames = deque()  # (offset, length, timestamp), oldest first
+        self._head = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def add(self, data, timestamp):
+        """
+        Copy a frame into the arena, dropping the oldest frames to make room. Frames larger than the arena
+        are ignored.
+
+        :param data: JPEG bytes.
+        :param timestamp: When the frame was received.
+        """
+        length = len(data)
+        if length > self.capacity:
+            return
+        frames = self.frames
+        start = self._head
+        if start + length > self.capacity:
+            # Wrap around. The space from the head to the end of the arena is skipped, so the frames still
+            # in it are from the previous lap and are dropped before writing from the start.
+            while frames and frames[0][0] >= start:
+                frames.popleft()
+            start = 0
+        end = start + length
+        while frames:
+            offset, size, frame_time = frames[0]
+            if offset < end and start < offset + size:
+                frames.popleft()
+            elif timestamp - frame_time > self.max_age:
+                frames.popleft()
+            else:
+                break
+        self.view[start:end] = data
+        frames.append((start, length, timestamp))
+        self._head = end
+
+    def drain(self):
+        """
+        Returns the buffered frames as (memoryview, timestamp) tuples, oldest first, and empties the buffer.
+        The views are valid until more frames are added.
+        """
+        frames = [(self.view[offset:offset + size], timestamp) for offset, size, timestamp in self.frames]
+        self.frames.clear()
+        return frames
+
+
+class AviWriter(object):
+    """
+    Writes an MJPEG AVI file one frame at a time. The header is written with placeholders and fixed up when
+    the file is closed.
+
+    :param path: File to write.
+    :param width: Frame width in pixels.
+    :param height: Frame height in pixels.
+    :param fps: Frame rate used until the real rate is known at close.
+    """
+    def __init__(self, path, width, height, fps=10):
+        self.path = path
+        self.file = open(path, "wb")
+        self.frame_count = 0
+        self.max_frame_size = 0
+        self.index = []
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+        microseconds = int(1000000 / fps)
+        avih = pack("<14I", microseconds, 0, 0, 0x10, 0, 0, 1, 0, width, height, 0, 0, 0, 0)
+        strh = b"vidsMJPG" + pack("<IHHIIIIIIIIHHHH", 0, 0, 0, 0, 1, int(fps), 0, 0, 0, 0xFFFFFFFF, 0,
+                                  0, 0, width, height)
+        strf = pack("<IiiHH4sIiiII", 40, width, height, 1, 24, b"MJPG", width * height * 3, 0, 0, 0, 0)
+        strl = b"strl" + b"strh" + pack("<I", len(strh)) + strh + b"strf" + pack("<I", len(strf)) + strf
+        hdrl = b"hdrl" + b"avih" + pack("<I", len(avih)) + avih + b"LIST" + pack("<I", len(strl)) + strl
+
+        self.file.write(b"RIFF" + pack("<I", 0) + b"AVI ")
+        self._avih_offset = self.file.tell() + 12 + 8
+        self._strh_offset = self._avih_offset + len(avih) + 12 + 8
+        self.file.write(b"LIST" + pack("<I", len(hdrl)) + hdrl)
+        self._movi_offset = self.file.tell()
+        self.file.write(b"LIST" + pack("<I", 0) + b"movi")
+
+    def write(self, data, timestamp):
+        """
+        Append a frame.
+
+        :param data: JPEG bytes or memoryview.
+        :param timestamp: When the frame was received, used to work out the frame rate.
+        """
+        size = len(data)
+        self.index.append((self.file.tell() - self._movi_offset - 8, size))
+        self.file.write(b"00dc" + pack("<I", size))
+        self.file.write(data)
+        if size & 1:
+            self.file.write(b"\0")
+        self.frame_count += 1
+        self.max_frame_size = max(self.max_frame_size, size)
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+
+    def close(self):
+        """
+        Write the index and fix up the header sizes and frame rate.
+        """
+        movi_end = self.file.tell()
+        index = bytearray()
+        for offset, size in self.index:
+            index += b"00dc" + pack("<III", 0x10, offset, size)
+        self.file.write(b"idx1" + pack("<I", len(index)))
+        self.file.write(index)
+        file_end = self.file.tell()
+
+        fps = 10
+        if self.frame_count > 1 and self.last_timestamp > self.first_timestamp:
+            fps = (self.frame_count - 1) / (self.last_timestamp - self.first_timestamp)
+        microseconds = int(1000000 / fps)
+
+        self.file.seek(4)
+        self.file.write(pack("<I", file_end - 8))
+        self.file.seek(self._avih_offset)
+        self.file.write(pack("<I", microseconds))
+        self.file.seek(self._avih_offset + 16)
+        self.file.write(pack("<I", self.frame_count))
+        self.file.seek(self._avih_offset + 28)
+        self.file.write(pack("<I", self.max_frame_size))
+        self.file.seek(self._strh_offset + 20)
+        self.file.write(pack("<II", 1000000, int(fps * 1000000)))
+        self.file.seek(self._strh_offset + 32)
+        self.file.write(pack("<II", self.frame_count, self.max_frame_size))
+        self.file.seek(self._movi_offset + 4)
+        self.file.write(pack("<I", movi_end - self._movi_offset - 8))
+        self.file.close()
+
+
+class ClipRecorder(object):
+    """
+    Buffers recent frames from the frame hub and writes event clips.
+
+    :param frame_hub: The device's FrameHub.
+    :param directory: Where clips are saved.
+    :param name: Used in the clip file names.
+    :param pre_seconds: Seconds of frames before the event to include.
+    :param max_bytes: Memory used for the pre-event buffer.
+    :param max_clip_seconds: Longest clip, in case the event never ends.
+    """
+    def __init__(self, frame_hub, directory, name, pre_seconds=5, max_bytes=16 * 1024 * 1024,
+                 max_clip_seconds=300):
+        self.frame_hub = frame_hub
+        self.directory = directory
+        self.name = name
+        self.max_clip_seconds = max_clip_seconds
+        self.arena = FrameArena(max_bytes, pre_seconds)
+        self.consumer = None
+        self.writer = None
+        self.clips_written = 0
+        self.last_clip = None
+
+    def open(self):
+        """
+        Start buffering frames.
+        """
+        if self.consumer is None:
+            self.consumer = self.frame_hub.add_consumer("recorder", max_queue=1, callback=self.frame_received)
+
+    def close(self):
+        """
+        Stop buffering and finish any clip in progress.
+        """
+        self.stop_clip()
+        if self.consumer is not None:
+            self.consumer.close()
+            self.consumer = None
+
+    def frame_received(self, frame):
+        """
+        Called by the frame hub with each frame.
+        """
+        if self.writer is not None:
+            self.writer.write(frame.data, frame.timestamp)
+            if frame.timestamp - self.writer.first_timestamp > self.max_clip_seconds:
+                self.stop_clip()
+        else:
+            self.arena.add(frame.data, frame.timestamp)
+
+    def start_clip(self):
+        """
+        Start a clip with the buffered frames, called when motion starts.
+        """
+        if self.writer is not None or self.consumer is None:
+            return
+        frames = self.arena.drain()
+        if not frames:
+            return
+        width, height = jpeg_size(frames[-1][0])
+        path = os.path.join(self.directory, f"{self.name}_{strftime('%Y%m%d_%H%M%S', localtime())}.avi")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self.writer = AviWriter(path, width, height)
+            for data, timestamp in frames:
+                self.writer.write(data, timestamp)
+        except OSError as e:
+            logger.warn("Unable to write clip {path}: {error}", path=path, error=e)
+            self.writer = None
+
+    def stop_clip(self):
+        """
+        Finish the clip in progress, called when motion ends.
+        """
+        if self.writer is None:
+            return
+        writer, self.writer = self.writer, None
+        try:
+            writer.close()
+        except OSError as e:
+            logger.warn("Unable to finish clip {path}: {error}", path=writer.path, error=e)
+            return
+        self.clips_written += 1
+        self.last_clip = writer.path
+
+    @property
+    def stats(self):
+        """
+        Returns a dictionary of recorder statistics, used for debug data.
+        """
+        return {
+            "buffer_bytes": self.arena.capacity,
+            "buffered_frames": len(self.arena),
+            "recording": self.writer is not None,
+            "clips_written": self.clips_written,
+            "last_clip": self.last_clip,
+        }
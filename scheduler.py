@@ -0,0 +1,177 @@
+"""
+Adaptive status polling for all Android IP Webcam devices.
+
+Polls are spread across the interval with random jitter so a large fleet doesn't poll in bursts. Devices that
+are unavailable back off exponentially, and devices with recent activity (motion, setting changes) are polled
+faster for a while.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from random import uniform
+from time import time
+
+from twisted.internet import reactor
+from twisted.internet.defer import maybeDeferred
+from twisted.python.failure import Failure
+
+from yombo.core.log import get_logger
+
+logger = get_logger("modules.android_ipwebcam.scheduler")
+
+
+class PollEntry(object):
+    """
+    Scheduling state for a single device.
+    """
+    __slots__ = ("device", "interval", "due", "call", "failures", "last_poll", "lag", "duration", "polling")
+
+    def __init__(self, device):
+        self.device = device
+        self.interval = None
+        self.due = None
+        self.call = None
+        self.failures = 0
+        self.last_poll = None
+        self.lag = 0
+        self.duration = None
+        self.polling = False
+
+    @property
+    def stats(self):
+        return {
+            "interval": None if self.interval is None else round(self.interval, 2),
+            "lag": round(self.lag, 4),
+            "failures": self.failures,
+            "last_poll": self.last_poll,
+            "last_duration": self.duration,
+        }
+
+
+class PollScheduler(object):
+    """
+    Calls update() on each device on an adaptive interval.
+
+    :param interval: Normal seconds between polls.
+    :param min_interval: Seconds between polls for devices with recent activity.
+    :param max_interval: Longest back off for unavailable devices.
+    :param jitter: Fraction of the interval to randomly add or remove from each poll.
+    :param activity_window: Seconds after activity that a device is polled at min_interval.
+    """
+    def __init__(self, interval=30, min_interval=5, max_interval=600, jitter=0.1, activity_window=60):
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.activity_window = activity_window
+        self.entries = {}
+        self.running = False
+
+    def add(self, device):
+        """
+        Start polling a device. The first poll is placed randomly within the interval to spread the load.
+        """
+        if device.device_id in self.entries:
+            return
+        entry = PollEntry(device)
+        self.entries[device.device_id] = entry
+        if self.running:
+            self._schedule(entry, uniform(0, self.interval))
+
+    def remove(self, device):
+        """
+        Stop polling a device.
+        """
+        entry = self.entries.pop(device.device_id, None)
+        if entry is not None:
+            self._cancel(entry)
+
+    def start(self):
+        """
+        Start polling all devices.
+        """
+        if self.running:
+            return
+        self.running = True
+        for entry in self.entries.values():
+            self._schedule(entry, uniform(0, self.interval))
+
+    def stop(self):
+        """
+        Stop polling all devices.
+        """
+        self.running = False
+        for entry in self.entries.values():
+            self._cancel(entry)
+
+    def boost(self, device):
+        """
+        Bring a device's next poll forward to min_interval, used when the device reports activity.
+        """
+        entry = self.entries.get(device.device_id)
+        if entry is None or self.running is False or entry.polling:
+            return
+        entry.interval = self.min_interval
+        if entry.due is None or entry.due - time() > self.min_interval:
+            self._cancel(entry)
+            self._schedule(entry, self.min_interval)
+
+    def device_stats(self, device):
+        """
+        Returns the scheduling details for a device, or None if it's not scheduled.
+        """
+        entry = self.entries.get(device.device_id)
+        if entry is None:
+            return None
+        return entry.stats
+
+    @property
+    def stats(self):
+        """
+        Returns the scheduling details for all devices.
+        """
+        return {device_id: entry.stats for device_id, entry in self.entries.items()}
+
+    def _cancel(self, entry):
+        if entry.call is not None and entry.call.active():
+            entry.call.cancel()
+        entry.call = None
+        entry.due = None
+
+    def _schedule(self, entry, delay):
+        entry.due = time() + delay
+        entry.call = reactor.callLater(delay, self._poll, entry)
+
+    def _next_interval(self, entry):
+        device = entry.device
+        if device.available is False:
+            return min(self.interval * 2 ** entry.failures, self.max_interval)
+        last_activity = getattr(device, "last_activity", None)
+        if last_activity is not None and time() - last_activity < self.activity_window:
+            return self.min_interval
+        return self.interval
+
+    def _poll(self, entry):
+        entry.call = None
+        started = time()
+        entry.lag = started - entry.due
+        entry.due = None
+        entry.polling = True
+        maybeDeferred(entry.device.update).addBoth(self._polled, entry, started)
+
+    def _polled(self, results, entry, started):
+        entry.polling = False
+        entry.last_poll = started
+        entry.duration = round(time() - started, 4)
+        if isinstance(results, Failure):
+            logger.warn("Error polling IP Webcam {label}: {error}",
+                        label=entry.device.label, error=results.getErrorMessage())
+
+        if entry.device.available is False:
+            entry.failures += 1
+        else:
+            entry.failures = 0
+        if self.running is False or entry.device.device_id not in self.entries:
+            return
+        entry.interval = self._next_interval(entry)
+        self._schedule(entry, entry.interval * uniform(1 - self.jitter, 1 + self.jitter))
@@ -0,0 +1,226 @@
+"""
+In-memory time series storage for the phone's sensors.
+
+Each sensor is stored in fixed size ring buffers of doubles, one for the timestamps and one for each value
+column (the accelerometer reports three values per sample, the battery one). Memory is allocated once when a
+sensor is first seen and stays flat no matter how long the gateway runs.
+
+If NumPy is installed, window queries are vectorized over the buffers without copying them. It's imported the
+first time statistics are asked for, not when the module loads.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from array import array
+
+
+class SensorSeries(object):
+    """
+    Ring buffer of samples for a single sensor. Timestamps are the phone's, in milliseconds.
+
+    :param name: Sensor name, such as "battery_level".
+    :param unit: Unit reported by the phone.
+    :param capacity: Number of samples to keep.
+    :param width: Number of values per sample.
+    """
+    __slots__ = ("name", "unit", "capacity", "width", "timestamps", "columns", "count", "_next")
+
+    def __init__(self, name, unit, capacity, width=1):
+        self.name = name
+        self.unit = unit
+        self.capacity = capacity
+        self.width = width
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.columns = [array("d", bytes(8 * capacity)) for _ in range(width)]
+        self.count = 0
+        self._next = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, values):
+        """
+        Add a sample, overwriting the oldest once the buffer is full.
+
+        :param timestamp: Sample timestamp, in milliseconds.
+        :param values: Sequence of values, extra values are ignored and missing ones stored as NaN.
+        """
+        index = self._next
+        self.timestamps[index] = timestamp
+        for column_index, column in enumerate(self.columns):
+            try:
+                column[index] = values[column_index]
+            except (IndexError, TypeError, ValueError):
+                column[index] = float("nan")
+        self._next = (index + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    @property
+    def last_timestamp(self):
+        """ Timestamp of the newest sample, 0 if empty. """
+        if self.count == 0:
+            return 0
+        return self.timestamps[self._next - 1]
+
+    @property
+    def latest(self):
+        """
+        Returns the newest sample as (timestamp, values), or None if there are no samples.
+        """
+        if self.count == 0:
+            return None
+        index = self._next - 1
+        return self.timestamps[index], tuple(column[index] for column in self.columns)
+
+    def _segments(self, buffer, start):
+        """
+        Returns the samples from logical position start (0 is the oldest) to the newest, as up to two
+        slices of buffer. Slices of an array are copies, pass a memoryview of it to get views instead.
+        """
+        oldest = (self._next - self.count) % self.capacity
+        first = oldest + start
+        if first >= self.capacity:
+            first -= self.capacity
+            return [buffer[first:self._next]]
+        if self.count < self.capacity or self._next == 0:
+            return [buffer[first:first + self.count - start]]
+        return [buffer[first:], buffer[:self._next]]
+
+    def _window_start(self, seconds):
+        """
+        Logical position of the first sample within seconds of the newest sample.
+        """
+        cutoff = self.last_timestamp - seconds * 1000
+        oldest = (self._next - self.count) % self.capacity
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamps[(oldest + middle) % self.capacity] < cutoff:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def window(self, seconds=None):
+        """
+        Get samples, oldest first. Seconds are counted back from the newest sample since the phone's clock
+        may not match the gateway's.
+
+        :param seconds: How far back to go, None for everything stored.
+        :return: A tuple of (timestamps, [values for each column]).
+        """
+        start = 0 if seconds is None else self._window_start(seconds)
+        timestamps = array("d")
+        for segment in self._segments(self.timestamps, start):
+            timestamps.extend(segment)
+        columns = []
+        for column in self.columns:
+            values = array("d")
+            for segment in self._segments(column, start):
+                values.extend(segment)
+            columns.append(values)
+        return timestamps, columns
+
+    def stats(self, seconds=None):
+        """
+        Min, max and mean of each value column over the last seconds.
+
+        :param seconds: How far back to go, None for everything stored.
+        :return: Dictionary with count, min, max and mean. The min, max and mean are lists, one per column.
+        """
+        start = 0 if seconds is None else self._window_start(seconds)
+        count = self.count - start
+        results = {"count": count, "min": [], "max": [], "mean": []}
+        if count == 0:
+            return results
+
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        for column in self.columns:
+            segments = self._segments(memoryview(column), start)
+            if numpy is not None:
+                views = [numpy.frombuffer(segment, dtype=numpy.float64) for segment in segments]
+                results["min"].append(float(min(view.min() for view in views)))
+                results["max"].append(float(max(view.max() for view in views)))
+                results["mean"].append(float(sum(view.sum() for view in views) / count))
+            else:
+                results["min"].append(min(min(segment) for segment in segments))
+                results["max"].append(max(max(segment) for segment in segments))
+                results["mean"].append(sum(sum(segment) for segment in segments) / count)
+        return results
+
+
+class SensorStore(object):
+    """
+    Holds a SensorSeries for each sensor the phone reports.
+
+    :param capacity: Number of samples to keep for each sensor.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.series = {}
+
+    def __contains__(self, name):
+        return name in self.series
+
+    def __len__(self):
+        return len(self.series)
+
+    def get(self, name):
+        """
+        Get the SensorSeries for a sensor, or None if the phone hasn't reported it.
+        """
+        return self.series.get(name)
+
+    @property
+    def names(self):
+        """ List of the sensors seen so far. """
+        return list(self.series)
+
+    def last_timestamp(self, name):
+        """ Timestamp of the newest sample for a sensor, 0 if none. """
+        series = self.series.get(name)
+        if series is None:
+            return 0
+        return series.last_timestamp
+
+    def merge(self, sensor_data):
+        """
+        Add the samples from a sensors.json response. Samples not newer than the last stored sample for a
+        sensor are skipped.
+
+        :param sensor_data: Decoded sensors.json response.
+        :return: Number of samples added.
+        """
+        added = 0
+        for name, container in sensor_data.items():
+            if not isinstance(container, dict):
+                continue
+            data_points = container.get("data") or []
+            series = self.series.get(name)
+            if series is None:
+                width = 1
+                for data_point in data_points:
+                    try:
+                        width = max(1, len(data_point[1]))
+                        break
+                    except (IndexError, TypeError):
+                        continue
+                series = SensorSeries(name, container.get("unit"), self.capacity, width)
+                self.series[name] = series
+
+            last_timestamp = series.last_timestamp
+            for data_point in data_points:
+                try:
+                    timestamp, values = data_point[0], data_point[1]
+                except (IndexError, TypeError):
+                    continue
+                if timestamp <= last_timestamp:
+                    continue
+                series.append(timestamp, values)
+                last_timestamp = timestamp
+                added += 1
+        return added
@@ -0,0 +1,88 @@
+"""
+Parsed settings for an Android IP Webcam.
+
+The status.json "curvals" and "avail" sections are parsed once per update into a SettingsSnapshot. Snapshots
+are read only and are only replaced when the phone reports something different, at which point the version
+is incremented. Callers can keep the version to cheaply tell if anything changed since they last looked.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from types import MappingProxyType
+
+
+def parse_setting_value(value):
+    """
+    Convert a setting value from the phone: numbers become floats and "on"/"off" become booleans.
+
+    :param value: Value as sent by the phone.
+    :return: The converted value.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    if value == "on" or value == "off":
+        return value == "on"
+    return value
+
+
+class SettingsSnapshot(object):
+    """
+    Read only view of the phone's current and available settings.
+
+    :param version: Version number, incremented each time the settings change.
+    :param curvals: The "curvals" dictionary from status.json.
+    :param avail: The "avail" dictionary from status.json.
+    """
+    __slots__ = ("version", "current", "available", "_curvals", "_avail", "_choices")
+
+    def __init__(self, version=0, curvals=None, avail=None):
+        self.version = version
+        self._curvals = curvals or {}
+        self._avail = avail or {}
+        self.current = MappingProxyType(
+            {key: parse_setting_value(value) for key, value in self._curvals.items()}
+        )
+        self.available = MappingProxyType(
+            {key: tuple(parse_setting_value(value) for value in values) for key, values in self._avail.items()}
+        )
+        self._choices = {key: frozenset(values) for key, values in self.available.items()}
+
+    def __contains__(self, key):
+        return key in self.current
+
+    def get(self, key, default=None):
+        """
+        Get the current value of a setting.
+
+        :param key: Setting name, such as "quality".
+        :param default: Returned if the setting isn't reported by the phone.
+        """
+        return self.current.get(key, default)
+
+    def raw(self, key, default=None):
+        """
+        Get the current value of a setting as sent by the phone, before conversion.
+        """
+        return self._curvals.get(key, default)
+
+    def is_available(self, key, value):
+        """
+        Check if value is one of the available choices for a setting.
+        """
+        choices = self._choices.get(key)
+        return choices is not None and value in choices
+
+    def updated(self, status_data):
+        """
+        Returns a snapshot for a new status.json response. If nothing changed, this snapshot is returned.
+
+        :param status_data: Decoded status.json response.
+        :return: SettingsSnapshot instance.
+        """
+        curvals = status_data.get("curvals", {})
+        avail = status_data.get("avail", self._avail)
+        if curvals == self._curvals and avail == self._avail:
+            return self
+        return SettingsSnapshot(self.version + 1, curvals, avail)
@@ -0,0 +1,114 @@
+"""
+Snapshot cache for an Android IP Webcam.
+
+Dashboards and automation rules can ask for the current image many times a second. The cache keeps the last
+image for max_age seconds, and callers that ask while a request to the phone is already in flight share that
+request instead of sending their own. When the frame hub is streaming, the newest frame is used and no request
+is sent to the phone at all.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from time import time
+
+from twisted.internet.defer import Deferred, maybeDeferred, succeed
+
+
+class Snapshot(object):
+    """
+    A cached image. The sequence goes up by one for each new image, and identifies it to the thumbnail cache.
+    """
+    __slots__ = ("sequence", "content_type", "data", "timestamp", "source")
+
+    def __init__(self, sequence, content_type, data, timestamp, source):
+        self.sequence = sequence
+        self.content_type = content_type
+        self.data = data
+        self.timestamp = timestamp
+        self.source = source
+
+    @property
+    def age(self):
+        """ Seconds since the image was captured. """
+        return time() - self.timestamp
+
+
+class SnapshotCache(object):
+    """
+    Caches the latest snapshot for a device and coalesces concurrent requests.
+
+    :param frame_hub: Callable returning the device's FrameHub, or None if it hasn't been created. The hub is
+        used as the image source while it's streaming.
+    :param fetch: Callable that returns a deferred firing with a (content_type, data) tuple.
+    :param max_age: Seconds a snapshot stays fresh.
+    """
+    def __init__(self, frame_hub, fetch, max_age=1.0):
+        self.frame_hub = frame_hub
+        self.fetch = fetch
+        self.max_age = max_age
+        self.snapshot = None
+        self.sequence = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.hub_fills = 0
+        self._waiters = None
+
+    def get(self):
+        """
+        Get a snapshot that is no older than max_age.
+
+        :return: Deferred that fires with a Snapshot instance.
+        """
+        hub = self.frame_hub()
+        frame = None if hub is None else hub.latest_frame
+        if frame is not None and hub.streaming and frame.age <= self.max_age:
+            if self.snapshot is None or self.snapshot.timestamp < frame.timestamp:
+                self.sequence += 1
+                self.snapshot = Snapshot(self.sequence, frame.content_type, frame.content, frame.timestamp,
+                                         "frame_hub")
+                self.hub_fills += 1
+            else:
+                self.hits += 1
+            return succeed(self.snapshot)
+
+        if self.snapshot is not None and self.snapshot.age <= self.max_age:
+            self.hits += 1
+            return succeed(self.snapshot)
+
+        d = Deferred()
+        if self._waiters is not None:
+            self.coalesced += 1
+            self._waiters.append(d)
+            return d
+
+        self.misses += 1
+        self._waiters = [d]
+        maybeDeferred(self.fetch).addCallbacks(self._fetched, self._fetch_failed)
+        return d
+
+    def _fetched(self, results):
+        content_type, data = results
+        self.sequence += 1
+        self.snapshot = Snapshot(self.sequence, content_type, data, time(), "request")
+        waiters, self._waiters = self._waiters, None
+        for waiter in waiters:
+            waiter.callback(self.snapshot)
+
+    def _fetch_failed(self, failure):
+        waiters, self._waiters = self._waiters, None
+        for waiter in waiters:
+            waiter.errback(failure)
+
+    @property
+    def stats(self):
+        """
+        Returns a dictionary of cache statistics, used for debug data.
+        """
+        return {
+            "max_age": self.max_age,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "frame_hub_fills": self.hub_fills,
+        }
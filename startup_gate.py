@@ -0,0 +1,113 @@
+"""
+Limits how many camera reloads and ffmpeg launches run at the same time.
+
+When the gateway starts with many cameras, every device would otherwise fetch its variables, poll its status
+and launch its ffmpeg sensors within the same few milliseconds. The gate queues the work and only lets a few
+run at once. It also records how long the ramp took and the CPU and memory used, so the limit can be tuned.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from collections import deque
+from time import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+from twisted.internet.defer import Deferred, maybeDeferred
+from twisted.python.failure import Failure
+
+
+def process_usage():
+    """
+    Returns a tuple of (cpu seconds, peak rss in KB) for the gateway process, or (None, None) if unknown.
+    """
+    if resource is None:
+        return None, None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss
+
+
+class ConcurrencyGate(object):
+    """
+    Runs callables with at most limit of them in progress at once.
+
+    :param name: Name used for stats.
+    :param limit: Maximum number running at once.
+    """
+    def __init__(self, name, limit=4):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.peak_active = 0
+        self.completed = 0
+        self.waiting = deque()
+        self.ramp_started = None
+        self.ramp_seconds = None
+        self.ramp_cpu_seconds = None
+        self.ramp_peak_rss = None
+        self._ramp_cpu_start = None
+
+    def run(self, function, *args, **kwargs):
+        """
+        Call function once a slot is free.
+
+        :return: Deferred that fires with the function's result.
+        """
+        d = Deferred()
+        self.waiting.append((d, function, args, kwargs))
+        self._start_waiting()
+        return d
+
+    def set_limit(self, limit):
+        """
+        Change the limit, starting queued calls if the limit went up.
+        """
+        self.limit = max(1, int(limit))
+        self._start_waiting()
+
+    def _start_waiting(self):
+        while self.waiting and self.active < self.limit:
+            d, function, args, kwargs = self.waiting.popleft()
+            if self.active == 0 and self.ramp_started is None:
+                self.ramp_started = time()
+                self._ramp_cpu_start = process_usage()[0]
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+            maybeDeferred(function, *args, **kwargs).addBoth(self._finished, d)
+
+    def _finished(self, results, d):
+        self.active -= 1
+        self.completed += 1
+        self._start_waiting()
+        if self.active == 0 and not self.waiting and self.ramp_started is not None:
+            cpu_seconds, peak_rss = process_usage()
+            self.ramp_seconds = round(time() - self.ramp_started, 3)
+            if cpu_seconds is not None:
+                self.ramp_cpu_seconds = round(cpu_seconds - self._ramp_cpu_start, 3)
+            self.ramp_peak_rss = peak_rss
+            self.ramp_started = None
+
+        if isinstance(results, Failure):
+            d.errback(results)
+        else:
+            d.callback(results)
+
+    @property
+    def stats(self):
+        """
+        Returns a dictionary of gate statistics. The ramp values are for the last time the gate went from
+        idle, to busy, and back to idle.
+        """
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": len(self.waiting),
+            "peak_active": self.peak_active,
+            "completed": self.completed,
+            "last_ramp_seconds": self.ramp_seconds,
+            "last_ramp_cpu_seconds": self.ramp_cpu_seconds,
+            "peak_rss_kb": self.ramp_peak_rss,
+        }
@@ -0,0 +1,29 @@
+"""
+Helpers for the long running streams (video and audio) read from an Android IP Webcam.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+import base64
+
+from twisted.internet import reactor
+from twisted.web.client import Agent
+from twisted.web.http_headers import Headers
+
+
+def stream_request(url, auth=None, timeout=5):
+    """
+    Start a GET request for a stream. The response body isn't buffered, use response.deliverBody() with a
+    protocol to receive it as it arrives.
+
+    :param url: URL of the stream.
+    :param auth: Optional (username, password) tuple for basic auth.
+    :param timeout: Seconds to wait for the connection.
+    :return: Deferred that fires with a twisted.web.client Response.
+    """
+    headers = Headers({b"User-Agent": [b"Yombo Android IP Webcam"]})
+    if auth:
+        credentials = base64.b64encode(f"{auth[0]}:{auth[1]}".encode())
+        headers.addRawHeader(b"Authorization", b"Basic " + credentials)
+    agent = Agent(reactor, connectTimeout=timeout)
+    return agent.request(b"GET", url.encode(), headers)
@@ -0,0 +1,31 @@
+"""
+Lets the tests run without a Yombo gateway install. When yombo can't be imported, the few core modules this
+package imports when it loads are replaced with minimal stand-ins.
+"""
+import sys
+from types import ModuleType
+
+try:
+    import yombo  # noqa: F401
+except ImportError:
+    class _Logger(object):
+        def __getattr__(self, name):
+            return lambda *args, **kwargs: None
+
+    class YomboWarning(Exception):
+        pass
+
+    class YomboModule(object):
+        pass
+
+    stubs = {
+        "yombo": {},
+        "yombo.core": {},
+        "yombo.core.exceptions": {"YomboWarning": YomboWarning},
+        "yombo.core.log": {"get_logger": lambda name: _Logger()},
+        "yombo.core.module": {"YomboModule": YomboModule},
+    }
+    for name, attributes in stubs.items():
+        module = ModuleType(name)
+        module.__dict__.update(attributes)
+        sys.modules[name] = module
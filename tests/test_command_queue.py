@@ -0,0 +1,59 @@
+"""
+Tests for the debounced settings writes.
+"""
+import os
+import sys
+
+from twisted.internet import task
+from twisted.internet.defer import succeed
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import command_queue  # noqa: E402
+
+
+def make_queue(monkeypatch, curvals):
+    clock = task.Clock()
+    monkeypatch.setattr(command_queue, "reactor", clock)
+    sent = []
+
+    def send(key, payload):
+        sent.append((key, payload))
+        curvals[key] = payload
+        return succeed(True)
+
+    return command_queue.SettingsCommandQueue(send, curvals.get), clock, sent
+
+
+def test_stale_poll_keeps_completed_write(monkeypatch):
+    """
+    A status poll sent before a write completed must not make the queue forget the write.
+    """
+    phone = {"quality": "50"}
+    polled = dict(phone)
+    queue, clock, sent = make_queue(monkeypatch, phone)
+    queue.current_value = polled.get  # The settings as last reported by a poll.
+
+    poll = queue.poll_started()
+    results = []
+    queue.set("quality", "70").addCallback(results.append)
+    clock.advance(1)
+    assert results == [True] and sent == [("quality", "70")]
+
+    queue.settings_updated(poll)  # The stale poll lands, still reporting 50.
+    queue.set("quality", "50")
+    clock.advance(1)
+    assert sent == [("quality", "70"), ("quality", "50")]
+
+
+def test_fresh_poll_forgets_completed_write(monkeypatch):
+    phone = {"quality": "50"}
+    queue, clock, sent = make_queue(monkeypatch, phone)
+    queue.set("quality", "70")
+    clock.advance(1)
+
+    queue.settings_updated(queue.poll_started())  # Sent after the write, reports 70.
+    queue.set("quality", "70")
+    clock.advance(1)
+    assert sent == [("quality", "70")]
+    assert queue.skipped == 1
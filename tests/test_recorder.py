@@ -0,0 +1,29 @@
+"""
+Tests for the clip recorder's frame arena.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recorder import FrameArena  # noqa: E402
+
+
+def test_wrap_drops_overwritten_frames():
+    """
+    After wrapping, frames from the previous lap that the new frame overlaps must not be returned.
+    """
+    arena = FrameArena(100, 60)
+    for timestamp, size in enumerate([95, 5, 60, 35, 10]):
+        arena.add(bytes([timestamp]) * size, timestamp)
+    frames = arena.drain()
+    assert [timestamp for data, timestamp in frames] == [3, 4]
+    for data, timestamp in frames:
+        assert bytes(data) == bytes([timestamp]) * len(data)
+
+
+def test_frames_are_kept_until_overwritten():
+    arena = FrameArena(100, 60)
+    for timestamp in range(5):
+        arena.add(bytes([timestamp]) * 20, timestamp)
+    assert [timestamp for data, timestamp in arena.drain()] == [0, 1, 2, 3, 4]
@@ -0,0 +1,134 @@
+"""
+Resized snapshot cache for camera grids.
+
+Dashboards showing many cameras at once ask for small images, often from several browsers at the same time.
+Each camera's snapshot is resized on the image worker pool once per new snapshot and size, and the result is
+kept in an LRU cache shared by all cameras and limited to a number of bytes. Callers that ask for a size
+that's being resized share the job.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from collections import OrderedDict
+
+from twisted.internet.defer import Deferred, succeed
+
+
+class ThumbnailCache(object):
+    """
+    Byte limited LRU cache of resized JPEGs, keyed by (device id, (width, height, quality), snapshot sequence).
+
+    :param max_bytes: Most bytes of images to keep.
+    """
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.entries = OrderedDict()  # key: jpeg bytes, least recently used first
+        self.newest = {}  # (device id, size): sequence of the cached entry
+        self.in_progress = {}  # key: list of waiting deferreds
+        self.evictions = 0
+        self.device_counts = {}  # device id: {"hits", "misses", "coalesced"}
+
+    def get(self, device_id, size, sequence, resize):
+        """
+        Get a resized image, calling resize() only if it's not cached or already being resized.
+
+        :param device_id: The camera's device id.
+        :param size: Tuple of (width, height, quality).
+        :param sequence: Sequence number of the snapshot being resized.
+        :param resize: Callable returning a deferred that fires with the resized jpeg bytes.
+        :return: Deferred that fires with the jpeg bytes.
+        """
+        key = (device_id, size, sequence)
+        counts = self.device_counts.setdefault(device_id, {"hits": 0, "misses": 0, "coalesced": 0})
+        image = self.entries.get(key)
+        if image is not None:
+            counts["hits"] += 1
+            self.entries.move_to_end(key)
+            return succeed(image)
+
+        d = Deferred()
+        waiters = self.in_progress.get(key)
+        if waiters is not None:
+            counts["coalesced"] += 1
+            waiters.append(d)
+            return d
+
+        counts["misses"] += 1
+        self.in_progress[key] = [d]
+        resize().addCallbacks(self._resized, self._resize_failed, callbackArgs=(key,), errbackArgs=(key,))
+        return d
+
+    def _resized(self, image, key):
+        self.put(key, image)
+        for waiter in self.in_progress.pop(key):
+            waiter.callback(image)
+
+    def _resize_failed(self, failure, key):
+        for waiter in self.in_progress.pop(key):
+            waiter.errback(failure)
+
+    def put(self, key, image):
+        """
+        Store an image, replacing the same device and size from an older snapshot and evicting the least
+        recently used images to stay within max_bytes.
+        """
+        device_id, size, sequence = key
+        previous = self.newest.get((device_id, size))
+        if previous is not None and previous > sequence:
+            return  # A newer snapshot was already resized.
+        if previous is not None:
+            self._remove((device_id, size, previous))
+        if len(image) > self.max_bytes:
+            return
+        self.entries[key] = image
+        self.newest[(device_id, size)] = sequence
+        self.bytes += len(image)
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        image = self.entries.pop(key, None)
+        if image is None:
+            return
+        self.bytes -= len(image)
+        device_id, size, sequence = key
+        if self.newest.get((device_id, size)) == sequence:
+            del self.newest[(device_id, size)]
+
+    def remove_device(self, device_id):
+        """
+        Drop all images for a device, used when it's unloaded.
+        """
+        for key in [key for key in self.entries if key[0] == device_id]:
+            self._remove(key)
+        self.device_counts.pop(device_id, None)
+
+    def device_stats(self, device_id):
+        """
+        Returns the hit rate and cached images for one device, used for debug data.
+        """
+        counts = self.device_counts.get(device_id, {"hits": 0, "misses": 0, "coalesced": 0})
+        requests = counts["hits"] + counts["misses"] + counts["coalesced"]
+        return {
+            **counts,
+            "hit_rate": None if requests == 0 else round((counts["hits"] + counts["coalesced"]) / requests, 3),
+            "cached_sizes": [key[1] for key in self.entries if key[0] == device_id],
+        }
+
+    @property
+    def stats(self):
+        """
+        Returns a dictionary of cache statistics for all devices.
+        """
+        hits = sum(counts["hits"] + counts["coalesced"] for counts in self.device_counts.values())
+        requests = hits + sum(counts["misses"] for counts in self.device_counts.values())
+        return {
+            "max_bytes": self.max_bytes,
+            "bytes": self.bytes,
+            "entries": len(self.entries),
+            "evictions": self.evictions,
+            "hit_rate": None if requests == 0 else round(hits / requests, 3),
+        }
@@ -0,0 +1,81 @@
+"""
+On/off state with hysteresis for the motion and noise detectors.
+
+A detector calls trigger() every time it sees motion or noise. The first trigger turns the state on; it turns
+off after low_timeout seconds without a trigger. Once off, it can't turn back on for reactivate_timeout seconds.
+The callback receives (state, duration, trip_count), the same as the ffmpeg sensors. If the detector reports
+which zone triggered, zone is also passed as a keyword argument.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from time import time
+
+from twisted.internet import reactor
+
+
+class TripState(object):
+    """
+    :param callback: Called with (state, duration, trip_count) when the state changes.
+    :param reactivate_timeout: Seconds after turning off before it can turn on again.
+    :param low_timeout: Seconds without a trigger before turning off.
+    """
+    def __init__(self, callback, reactivate_timeout=10, low_timeout=10):
+        self.callback = callback
+        self.reactivate_timeout = reactivate_timeout
+        self.low_timeout = low_timeout
+        self.state = False
+        self.started = None
+        self.trip_count = 0
+        self.last_low = None
+        self.zone = None
+        self._low_call = None
+
+    def trigger(self, zone=None):
+        """
+        Called each time the detector sees activity.
+
+        :param zone: Optional name of the zone that triggered, reported with the state change.
+        """
+        now = time()
+        if self.state is True:
+            self.trip_count += 1
+            self._low_call.reset(self.low_timeout)
+            return
+
+        if self.last_low is not None and now - self.last_low < self.reactivate_timeout:
+            return
+        self.state = True
+        self.started = now
+        self.trip_count = 1
+        self.zone = zone
+        self._low_call = reactor.callLater(self.low_timeout, self._go_low)
+        self._notify(True, 0)
+
+    def reconfigure(self, reactivate_timeout, low_timeout):
+        """
+        Change the timeouts. A running low timeout keeps its current deadline.
+        """
+        self.reactivate_timeout = reactivate_timeout
+        self.low_timeout = low_timeout
+
+    def reset(self):
+        """
+        Turn off now if on, used when the detector is closed.
+        """
+        if self._low_call is not None and self._low_call.active():
+            self._low_call.cancel()
+            self._go_low()
+
+    def _go_low(self):
+        self._low_call = None
+        now = time()
+        self.state = False
+        self.last_low = now
+        self._notify(False, round(now - self.started, 2))
+
+    def _notify(self, state, duration):
+        if self.zone is None:
+            self.callback(state, duration, self.trip_count)
+        else:
+            self.callback(state, duration, self.trip_count, zone=self.zone)
@@ -0,0 +1,138 @@
+"""
+Motion detection zones and exclusion masks.
+
+Zones are set with the motion_zones device variable and masks with motion_exclusions. Each value is one
+polygon, with an optional name, as points in percent of the frame's width and height:
+
+    driveway: 0,40 60,40 60,100 0,100
+
+The polygons are rasterized once, at the detection resolution, into an index of the active pixel blocks.
+The motion detector only compares those blocks, and reports which zone tripped.
+
+NumPy is only imported when a mask is built, so the device variables can be parsed without it.
+
+:copyright: 2018-2019 Yombo
+:license: YRPL
+"""
+from yombo.core.log import get_logger
+
+logger = get_logger("modules.android_ipwebcam.zones")
+
+BLOCK_SIZE = 8
+
+
+def parse_polygons(values):
+    """
+    Parse polygon definitions from device variable values. Invalid values are logged and skipped.
+
+    :param values: List of strings, such as ["driveway: 0,40 60,40 60,100 0,100"].
+    :return: List of (name, [(x, y), ...]) tuples, with x and y as fractions (0-1) of the frame.
+    """
+    polygons = []
+    for index, value in enumerate(values or []):
+        if not value:
+            continue
+        name, _, points_text = str(value).rpartition(":")
+        name = name.strip() or f"zone{index + 1}"
+        try:
+            points = [tuple(float(part) / 100 for part in point.split(",")) for point in points_text.split()]
+            if len(points) < 3 or any(len(point) != 2 for point in points):
+                raise ValueError("a polygon needs at least 3 x,y points")
+        except ValueError as e:
+            logger.warn("Ignoring motion zone '{value}': {error}", value=value, error=e)
+            continue
+        polygons.append((name, points))
+    return polygons
+
+
+def polygon_contains(points, x, y):
+    """
+    Vectorized even-odd point in polygon test.
+
+    :param points: List of (x, y) polygon points.
+    :param x: NumPy array of x coordinates.
+    :param y: NumPy array of y coordinates, same shape as x.
+    :return: Boolean NumPy array.
+    """
+    import numpy
+    inside = numpy.zeros(x.shape, dtype=bool)
+    previous_x, previous_y = points[-1]
+    for point_x, point_y in points:
+        if point_y != previous_y:
+            crosses = (point_y > y) != (previous_y > y)
+            edge_x = (previous_x - point_x) * (y - point_y) / (previous_y - point_y) + point_x
+            inside ^= crosses & (x < edge_x)
+        previous_x, previous_y = point_x, point_y
+    return inside
+
+
+class ZoneMask(object):
+    """
+    Block index for a set of zones and exclusions at a specific image size.
+
+    :param shape: (height, width) of the detection images.
+    :param zones: Parsed zone polygons, an empty list means the whole frame.
+    :param exclusions: Parsed exclusion polygons.
+    :param block_size: Size in pixels of the square blocks.
+    """
+    def __init__(self, shape, zones, exclusions, block_size=BLOCK_SIZE):
+        import numpy
+        self.shape = shape
+        self.block_size = block_size
+        self.rows = shape[0] // block_size
+        self.columns = shape[1] // block_size
+
+        # Block centers as fractions of the frame.
+        center_y, center_x = numpy.mgrid[0:self.rows, 0:self.columns].astype(numpy.float64)
+        center_x = ((center_x + 0.5) * block_size / shape[1]).ravel()
+        center_y = ((center_y + 0.5) * block_size / shape[0]).ravel()
+
+        excluded = numpy.zeros(center_x.shape, dtype=bool)
+        for name, points in exclusions:
+            excluded |= polygon_contains(points, center_x, center_y)
+
+        if not zones:
+            zones = [(None, None)]
+        zone_blocks = []
+        for name, points in zones:
+            if points is None:
+                selected = ~excluded
+            else:
+                selected = polygon_contains(points, center_x, center_y) & ~excluded
+            zone_blocks.append((name, numpy.flatnonzero(selected)))
+
+        # All active blocks, and each zone's positions within them.
+        self.index = numpy.unique(numpy.concatenate([blocks for name, blocks in zone_blocks]))
+        self.zones = [
+            (name, numpy.searchsorted(self.index, blocks), len(blocks) * block_size * block_size)
+            for name, blocks in zone_blocks if len(blocks)
+        ]
+
+    def gather(self, image):
+        """
+        Returns the active blocks of an image, as an array of (active blocks, block pixels).
+
+        :param image: 2d NumPy array with the mask's shape.
+        """
+        size = self.block_size
+        blocks = image[:self.rows * size, :self.columns * size] \
+            .reshape(self.rows, size, self.columns, size) \
+            .swapaxes(1, 2) \
+            .reshape(self.rows * self.columns, size * size)
+        return blocks[self.index]
+
+    def changed_zone(self, changed_per_block, percent):
+        """
+        Find the zone with the highest share of changed pixels that's at or above percent.
+
+        :param changed_per_block: NumPy array of the changed pixel count for each active block.
+        :param percent: Percent of a zone's pixels that must change.
+        :return: A tuple of (tripped, zone name).
+        """
+        best_name = None
+        best_share = -1
+        for name, positions, pixels in self.zones:
+            share = changed_per_block[positions].sum() * 100 / pixels
+            if share > best_share:
+                best_name, best_share = name, share
+        return best_share >= percent, best_name